@@ -0,0 +1,224 @@
+import uuid
+from datetime import datetime
+from typing import List
+from uuid import UUID
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app import company_status
+from app import hashing
+from app import model
+from app import repository
+from app import schema
+from app.normalization import normalize_text, normalize_digits
+from app.suggest import company_index
+from app.user_cache import bump_token_version_async, token_versions, user_changed_notification, \
+    user_cache
+from app.user_service.schema_user import UserCreate
+
+
+async def get_company(db: AsyncSession, company_id: UUID) -> model.Company:
+    result = await db.execute(select(model.Company).where(model.Company.id == company_id))
+    return result.scalars().first()
+
+
+async def get_existing_company_id_numbers(db: AsyncSession, id_numbers):
+    result = await db.execute(select(model.Company.id_number).where(model.Company.id_number.in_(id_numbers)))
+    return set(result.scalars().all())
+
+
+async def create_companies(db: AsyncSession, companies: List[schema.CompanyBase]):
+    rows = [{
+        "id": uuid.uuid4(),
+        "name": company.name,
+        "id_number": company.id_number,
+        "registry": company.registry,
+        "statute": company.status,
+        "dic": company.dic,
+        "status": company_status.NEW,
+        "search_name": normalize_text(company.name),
+        "search_id_number": normalize_digits(company.id_number),
+        "search_dic": normalize_digits(company.dic),
+    } for company in companies]
+
+    result = await db.execute(
+        postgresql.insert(model.Company).values(rows).on_conflict_do_nothing()
+        .returning(model.Company.id, model.Company.name, model.Company.id_number, model.Company.dic)
+    )
+    created = {row.id_number: row for row in result}
+
+    addresses = [{
+        "id": uuid.uuid4(),
+        "city": company.address.city,
+        "street": company.address.street,
+        "number": company.address.number,
+        "zip": company.address.zip,
+        "company_id": created[company.id_number].id,
+    } for company in companies if company.address is not None and company.id_number in created]
+
+    if addresses:
+        await db.execute(insert(model.Address).values(addresses))
+
+    await db.commit()
+
+    for row in created.values():
+        company_index.add_entry(row.id, row.name, row.id_number, row.dic)
+
+    return created
+
+
+async def get_person(db: AsyncSession, person_id: UUID) -> model.Person:
+    result = await db.execute(select(model.Person).where(model.Person.id == person_id,
+                                                         model.Person.deleted_at == None))
+    return result.scalars().first()
+
+
+async def get_person_by_company_and_id(db: AsyncSession, company_id: UUID, person_id: UUID):
+    result = await db.execute(select(model.Person).where(model.Person.id == person_id,
+                                                         model.Person.deleted_at == None,
+                                                         model.Person.company_id == company_id))
+    return result.scalars().first()
+
+
+async def get_persons_by_company(db: AsyncSession, company_id: UUID):
+    result = await db.execute(select(model.Person).where(model.Person.company_id == company_id,
+                                                         model.Person.deleted_at == None))
+    return result.scalars().all()
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(model.User).where(model.User.email == email))
+    return result.scalars().first()
+
+
+async def get_user_by_email_active(db: AsyncSession, email: str):
+    user = await get_user_by_email(db, email)
+
+    if user is not None and user.active is True:
+        return user
+
+    return None
+
+
+async def create_user(db: AsyncSession, user: UserCreate):
+    db_user = model.User(
+        email=user.email,
+        name=user.name,
+        surname=user.surname,
+        password=await hashing.hash_password(user.password),
+        active=False
+    )
+
+    db.add(db_user)
+    await db.execute(user_changed_notification(db_user.email))
+    await db.commit()
+    user_cache.invalidate(db_user.email)
+    await db.refresh(db_user)
+
+    return db_user
+
+
+async def create_reset_token(db: AsyncSession, user: model.User):
+    token = model.ResetToken(user_id=user.id)
+
+    db.add(token)
+    await db.commit()
+    await db.refresh(token)
+
+    return token
+
+
+async def get_reset_token(db: AsyncSession, token: UUID):
+    result = await db.execute(select(model.ResetToken).options(selectinload(model.ResetToken.user))
+                              .where(model.ResetToken.token == token, model.ResetToken.used_at == None))
+    return result.scalars().first()
+
+
+async def update_user_password(db: AsyncSession, user: model.User, new_password: str):
+    user.password = await hashing.hash_password(new_password)
+    version = await bump_token_version_async(db, user)
+    await db.execute(user_changed_notification(user.email))
+    await db.commit()
+    user_cache.invalidate(user.email)
+    token_versions.set(str(user.id), version)
+    await db.refresh(user)
+
+    return user
+
+
+async def mark_person_requested(db: AsyncSession, db_person: model.Person):
+    db_person.requested_at = datetime.now()
+
+    if db_person.company_id is not None:
+        await company_status.apply_async(db, company_status.kyc_requested(db_person.company_id))
+
+    await db.commit()
+    await db.refresh(db_person)
+
+    return db_person
+
+
+async def verify_person(db: AsyncSession, db_person: model.Person, person: schema.PersonVerify):
+    await db.execute(update(model.Address).where(model.Address.person_id == db_person.id).values(person_id=None))
+
+    if person.address is not None:
+        db.add(model.Address(
+            city=person.address.city,
+            street=person.address.street,
+            number=person.address.number,
+            person_id=db_person.id
+        ))
+
+    db_person.name = person.name
+    db_person.surname = person.surname
+    db_person.country = person.country
+    db_person.id_number = person.id_number
+    db_person.document_type = person.document_type
+    db_person.document_number = person.document_number
+    await run_in_threadpool(repository.store_person_documents, db_person, person)
+
+    verified = (await db.execute(repository.person_verified_update(db_person.id))).first() is not None
+
+    if verified and db_person.company_id is not None:
+        await db.execute(repository.company_counters_update(db_person.company_id, persons_verified=1))
+        await company_status.apply_async(db, company_status.kyc_verified(db_person.company_id))
+
+    await db.commit()
+    await db.refresh(db_person)
+
+    return db_person
+
+
+async def get_finstat_cache(db: AsyncSession, ico: str) -> model.FinstatCache:
+    result = await db.execute(select(model.FinstatCache).where(model.FinstatCache.ico == ico))
+    return result.scalars().first()
+
+
+async def save_finstat_cache(db: AsyncSession, ico: str, data: dict, fetched_at: datetime):
+    statement = postgresql.insert(model.FinstatCache).values(ico=ico, data=data, fetched_at=fetched_at)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[model.FinstatCache.ico],
+        set_={"data": statement.excluded.data, "fetched_at": statement.excluded.fetched_at},
+    ))
+    await db.commit()
+
+
+async def write_finstat_company_data(db: AsyncSession, finstat: schema.FinstatCompany, fetched_at: datetime):
+    if not finstat.Ico:
+        return None
+
+    result = await db.execute(select(model.Company).options(selectinload(model.Company.addresses))
+                              .where(model.Company.id_number == finstat.Ico))
+    company = result.scalars().first()
+    if company is None:
+        return None
+
+    repository.write_finstat_company_data(company, finstat, fetched_at)
+    await db.commit()
+    company_index.add(company)
+
+    return company
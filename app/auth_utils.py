@@ -4,16 +4,17 @@ from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from app import schema, repository
-from app.database import get_db
+from app import model, schema, async_repository
+from app.database import get_async_db
+from app.user_cache import token_versions, user_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -24,15 +25,38 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-        token_data = schema.TokenData(email=email)
-    except JWTError:
+        token_data = schema.TokenData(email=email, user_id=payload.get("uid"), active=payload.get("act"),
+                                      version=payload.get("ver"))
+    except (JWTError, ValueError):
         raise credentials_exception
-    user = repository.get_user_by_email_active(db, email=token_data.email)
+    if token_data.user_id is not None and token_data.version is not None:
+        if token_data.active is not True:
+            raise credentials_exception
+        current_version = token_versions.get(str(token_data.user_id))
+        if current_version is not None:
+            if current_version != token_data.version:
+                raise credentials_exception
+            return model.User(id=token_data.user_id, email=token_data.email, active=True,
+                              token_version=token_data.version)
+    user = user_cache.get(token_data.email)
     if user is None:
+        user = await async_repository.get_user_by_email_active(db, email=token_data.email)
+        if user is None:
+            raise credentials_exception
+        user_cache.put(token_data.email, user)
+    if token_data.version is not None and user.token_version != token_data.version:
         raise credentials_exception
     return user
 
 
+async def get_current_admin(current_user: model.User = Depends(get_current_user)):
+    # The system admin created at startup is the only admin account
+    if current_user.email != os.environ["ADMIN_MAIL"]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required.")
+
+    return current_user
+
+
 SECRET_KEY = os.environ["JWT_SECRET"]
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
@@ -0,0 +1,127 @@
+import base64
+import hashlib
+import os
+import re
+import sys
+import tempfile
+
+BLOB_STORE_PATH = os.environ.get("BLOB_STORE_PATH", "/data/blobs")
+CHUNK_SIZE = 64 * 1024
+BASE64 = re.compile(r'[A-Za-z0-9+/]*={0,2}')
+
+MEDIA_TYPES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF8', 'image/gif'),
+    (b'%PDF', 'application/pdf'),
+)
+
+
+def check_store():
+    if not os.path.isabs(BLOB_STORE_PATH):
+        sys.exit(f'BLOB_STORE_PATH "{BLOB_STORE_PATH}" must be an absolute path on a persistent volume')
+
+    os.makedirs(BLOB_STORE_PATH, exist_ok=True)
+
+
+def blob_path(digest: str):
+    return os.path.join(BLOB_STORE_PATH, digest[:2], digest[2:4], digest)
+
+
+def exists(digest: str):
+    return digest is not None and os.path.isfile(blob_path(digest))
+
+
+def put_file(source):
+    os.makedirs(BLOB_STORE_PATH, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+
+    with tempfile.NamedTemporaryFile(dir=BLOB_STORE_PATH, delete=False) as target:
+        try:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                target.write(chunk)
+                size += len(chunk)
+        except BaseException:
+            os.unlink(target.name)
+            raise
+
+    ref = digest.hexdigest()
+    path = blob_path(ref)
+
+    if os.path.exists(path):
+        os.unlink(target.name)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(target.name, path)
+
+    return ref, size
+
+
+def put_bytes(data: bytes):
+    ref = hashlib.sha256(data).hexdigest()
+    path = blob_path(ref)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as target:
+            target.write(data)
+        os.replace(target.name, path)
+
+    return ref
+
+
+def _base64_payload(value: str):
+    if value.startswith('data:') and ',' in value:
+        return value.split(',', 1)[1]
+
+    return value
+
+
+def is_base64(value: str):
+    # Accepts exactly what decode_base64 does without decoding the whole document
+    payload = _base64_payload(value)
+
+    return len(payload) % 4 == 0 and BASE64.fullmatch(payload) is not None
+
+
+def decode_base64(value: str, validate: bool = True):
+    return base64.b64decode(_base64_payload(value), validate=validate)
+
+
+def put_base64(value: str):
+    return put_bytes(decode_base64(value))
+
+
+def verify(digest: str):
+    if not exists(digest):
+        return False
+
+    hashed = hashlib.sha256()
+    with open(blob_path(digest), 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hashed.update(chunk)
+
+    return hashed.hexdigest() == digest
+
+
+def read_bytes(digest: str):
+    with open(blob_path(digest), 'rb') as f:
+        return f.read()
+
+
+def media_type(data: bytes):
+    for magic, media in MEDIA_TYPES:
+        if data.startswith(magic):
+            return media
+
+    return 'application/octet-stream'
+
+
+def file_media_type(digest: str):
+    with open(blob_path(digest), 'rb') as f:
+        return media_type(f.read(16))
@@ -0,0 +1,198 @@
+import csv
+import json
+import os
+from collections import deque
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import async_repository
+from app import schema
+
+IMPORT_BATCH_SIZE = int(os.environ.get("COMPANY_IMPORT_BATCH_SIZE", 500))
+IMPORT_MAX_RECORD_LINES = int(os.environ.get("COMPANY_IMPORT_MAX_RECORD_LINES", 50))
+IMPORT_MAX_RECORD_BYTES = int(os.environ.get("COMPANY_IMPORT_MAX_RECORD_BYTES", 64 * 1024))
+
+CSV_CONTENT_TYPES = ("text/csv",)
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+ADDRESS_FIELDS = ("city", "street", "number", "zip")
+
+
+async def _iter_lines(request: Request):
+    buffer = b''
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line
+
+    if buffer:
+        yield buffer
+
+
+def _decode_line(line: bytes):
+    return line.decode('utf-8').lstrip('\ufeff').rstrip('\r')
+
+
+class _LineFeed(deque):
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self:
+            raise StopIteration
+        return self.popleft()
+
+
+def _next_row(reader, feed: _LineFeed):
+    try:
+        return next(reader), None
+    except csv.Error as e:
+        feed.clear()
+        return None, str(e)
+
+
+async def _iter_csv_rows(request: Request):
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    quotes = 0
+    size = 0
+    line_number = 0
+
+    async for raw_line in _iter_lines(request):
+        line_number += 1
+        try:
+            line = raw_line.decode('utf-8').lstrip('\ufeff')
+        except ValueError as e:
+            feed.clear()
+            quotes = size = 0
+            yield None, str(e)
+            continue
+
+        feed.append(line + '\n')
+        quotes += line.count('"')
+        size += len(raw_line)
+        if quotes % 2 == 0:
+            quotes = size = 0
+            while feed:
+                yield _next_row(reader, feed)
+        elif len(feed) > IMPORT_MAX_RECORD_LINES or size > IMPORT_MAX_RECORD_BYTES:
+            # An unclosed quote would otherwise buffer the rest of the file as one record
+            start = line_number - len(feed) + 1
+            feed.clear()
+            quotes = size = 0
+            yield None, f"Quoted field opened on line {start} is not closed within {IMPORT_MAX_RECORD_LINES} " \
+                        f"lines or {IMPORT_MAX_RECORD_BYTES} bytes."
+
+    while feed:
+        yield _next_row(reader, feed)
+
+
+def _csv_record(header, values):
+    record = {key: value or None for key, value in zip(header, values)}
+    address = {field: record.pop(field, None) for field in ADDRESS_FIELDS}
+
+    if any(address.values()):
+        record["address"] = address
+
+    return record
+
+
+async def _iter_csv_companies(request: Request):
+    header = None
+    row_number = 0
+
+    async for values, error in _iter_csv_rows(request):
+        if header is None:
+            if error is not None:
+                raise HTTPException(status_code=400, detail=f"Invalid CSV header: {error}")
+            if values:
+                header = [column.strip() for column in values]
+            continue
+
+        if not values and error is None:
+            continue
+
+        row_number += 1
+        if error is not None:
+            yield row_number, None, error
+            continue
+
+        try:
+            yield row_number, schema.CompanyBase.parse_obj(_csv_record(header, values)), None
+        except (ValueError, ValidationError) as e:
+            yield row_number, None, str(e)
+
+
+async def _iter_ndjson_companies(request: Request):
+    row_number = 0
+
+    async for raw_line in _iter_lines(request):
+        if not raw_line.strip():
+            continue
+
+        row_number += 1
+        try:
+            yield row_number, schema.CompanyBase.parse_obj(json.loads(_decode_line(raw_line))), None
+        except (ValueError, ValidationError) as e:
+            yield row_number, None, str(e)
+
+
+async def iter_companies(request: Request):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if content_type in CSV_CONTENT_TYPES:
+        companies = _iter_csv_companies(request)
+    elif content_type in NDJSON_CONTENT_TYPES:
+        companies = _iter_ndjson_companies(request)
+    else:
+        raise HTTPException(status_code=415, detail="Import accepts text/csv or application/x-ndjson.")
+
+    async for row in companies:
+        yield row
+
+
+async def _import_batch(db: AsyncSession, batch):
+    id_numbers = {company.id_number for _, company in batch}
+    existing = await async_repository.get_existing_company_id_numbers(db, id_numbers)
+
+    to_create = {}
+    for _, company in batch:
+        if company.id_number not in existing and company.id_number not in to_create:
+            to_create[company.id_number] = company
+
+    created = await async_repository.create_companies(db, list(to_create.values())) if to_create else {}
+    results = []
+
+    for row_number, company in batch:
+        db_company = created.pop(company.id_number, None)
+        if db_company is not None:
+            results.append({"row": row_number, "id_number": company.id_number, "status": "created",
+                            "id": db_company.id})
+        else:
+            results.append({"row": row_number, "id_number": company.id_number, "status": "duplicate",
+                            "detail": "Company with same ID Number or name already exists!"})
+
+    return results
+
+
+async def import_companies(db: AsyncSession, request: Request):
+    results = []
+    batch = []
+
+    async for row_number, company, error in iter_companies(request):
+        if error is not None:
+            results.append({"row": row_number, "status": "invalid", "detail": error})
+            continue
+
+        batch.append((row_number, company))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            results.extend(await _import_batch(db, batch))
+            batch = []
+
+    if batch:
+        results.extend(await _import_batch(db, batch))
+
+    return sorted(results, key=lambda result: result["row"])
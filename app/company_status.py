@@ -0,0 +1,67 @@
+from uuid import UUID
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import model
+
+NEW = 1
+BENEFICIARIES_ADDED = 2
+AML_COMPLETED = 3
+KYC_REQUESTED = 4
+KYC_VERIFIED = 5
+
+
+def _transition(company_id: UUID, to_status: int, from_statuses=None, *criteria):
+    condition = model.Company.status.is_distinct_from(to_status) if from_statuses is None \
+        else model.Company.status.in_(from_statuses)
+
+    return update(model.Company).where(model.Company.id == company_id, condition, *criteria) \
+        .values(status=to_status).returning(model.Company.id, model.Company.status) \
+        .execution_options(synchronize_session=False)
+
+
+def beneficiary_added(company_id: UUID):
+    return _transition(company_id, BENEFICIARIES_ADDED)
+
+
+def beneficiaries_removed(company_id: UUID):
+    return _transition(company_id, NEW, None, model.Company.beneficiaries_active == 0)
+
+
+def aml_completed(company_id: UUID):
+    return _transition(company_id, AML_COMPLETED, (BENEFICIARIES_ADDED,))
+
+
+def kyc_requested(company_id: UUID):
+    return _transition(company_id, KYC_REQUESTED, (AML_COMPLETED,))
+
+
+def person_added(company_id: UUID):
+    return _transition(company_id, KYC_REQUESTED, (KYC_VERIFIED,))
+
+
+def kyc_verified(company_id: UUID):
+    return _transition(company_id, KYC_VERIFIED, (KYC_REQUESTED,),
+                       model.Company.persons_verified >= model.Company.persons_active)
+
+
+def _apply_result(session: Session, result):
+    row = result.first()
+
+    if row is not None:
+        company = session.identity_map.get(session.identity_key(model.Company, row.id))
+        if company is not None:
+            set_committed_value(company, "status", row.status)
+
+    return row is not None
+
+
+def apply(db: Session, statement):
+    return _apply_result(db, db.execute(statement))
+
+
+async def apply_async(db: AsyncSession, statement):
+    return _apply_result(db.sync_session, await db.execute(statement))
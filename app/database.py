@@ -1,11 +1,26 @@
 import os
 import sys
+import threading
+import time
 
-from sqlalchemy import create_engine
+from fastapi import Request, Response
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy_utils import database_exists
 
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", -1))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 0))
+DB_READ_PRIMARY_SECONDS = int(os.environ.get("DB_READ_PRIMARY_SECONDS", 10))
+READ_PRIMARY_COOKIE = "read_primary"
+READ_PRIMARY_HEADER = "X-Read-Primary"
+
 
 def get_db_link():
     return f'postgresql://' \
@@ -15,9 +30,105 @@ def get_db_link():
            f'{os.environ["POSTGRES_PORT"]}/' \
            f'{os.environ["POSTGRES_DATABASE"]}'
 
-engine = create_engine(get_db_link())
+
+def get_replica_db_link():
+    return os.environ.get("POSTGRES_REPLICA_DSN")
+
+
+def get_async_db_link():
+    return get_db_link().replace('postgresql://', 'postgresql+asyncpg://', 1)
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait_seconds, timed_out):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+    def snapshot(self, pool):
+        with self._lock:
+            waits = self.checkouts + self.timeouts
+            return {
+                "pool_size": pool.size(),
+                "max_overflow": DB_MAX_OVERFLOW,
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_avg": self.wait_seconds_total / waits if waits else 0.0,
+                "wait_seconds_max": self.wait_seconds_max,
+            }
+
+
+def instrumented_pool(pool_class, stats: PoolStats):
+    class InstrumentedPool(pool_class):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                stats.record(time.perf_counter() - started, timed_out=True)
+                raise
+            stats.record(time.perf_counter() - started, timed_out=False)
+            return connection
+
+    return InstrumentedPool
+
+
+def get_pool_options():
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def get_connect_args():
+    if not DB_STATEMENT_TIMEOUT_MS:
+        return {}
+    return {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+
+
+def get_async_connect_args():
+    if not DB_STATEMENT_TIMEOUT_MS:
+        return {}
+    return {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+
+
+engine_pool_stats = PoolStats()
+engine = create_engine(get_db_link(), poolclass=instrumented_pool(QueuePool, engine_pool_stats),
+                       connect_args=get_connect_args(), **get_pool_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+read_engine_pool_stats = PoolStats()
+if get_replica_db_link():
+    read_engine = create_engine(get_replica_db_link(), poolclass=instrumented_pool(QueuePool, read_engine_pool_stats),
+                                connect_args=get_connect_args(), **get_pool_options())
+else:
+    read_engine = engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+async_engine_pool_stats = PoolStats()
+async_engine = create_async_engine(get_async_db_link(),
+                                   poolclass=instrumented_pool(AsyncAdaptedQueuePool, async_engine_pool_stats),
+                                   connect_args=get_async_connect_args(), **get_pool_options())
+AsyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=async_engine,
+                                 class_=AsyncSession)
+
 if not database_exists(engine.url):
     sys.exit(f'Database "{os.environ["POSTGRES_DATABASE"]}" was not initialized with alembic')
 
@@ -30,3 +141,37 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db(request: Request):
+    if request.cookies.get(READ_PRIMARY_COOKIE) or request.headers.get(READ_PRIMARY_HEADER):
+        db = SessionLocal()
+    else:
+        db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def stick_to_primary(response: Response):
+    if read_engine is not engine:
+        response.set_cookie(READ_PRIMARY_COOKIE, "1", max_age=DB_READ_PRIMARY_SECONDS, httponly=True,
+                            secure=True, samesite="none")
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_pool_status():
+    status = {
+        "primary": engine_pool_stats.snapshot(engine.pool),
+        "primary_async": async_engine_pool_stats.snapshot(async_engine.sync_engine.pool),
+    }
+
+    if read_engine is not engine:
+        status["replica"] = read_engine_pool_stats.snapshot(read_engine.pool)
+
+    return status
@@ -0,0 +1,55 @@
+import os
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app import blob_store
+from app import model
+from app.database import SessionLocal
+from app.enums import DocumentKind
+
+CLEANUP_BATCH_SIZE = int(os.environ.get("DOCUMENT_CLEANUP_BATCH_SIZE", 100))
+
+
+def clear_legacy_documents(db: Session, kind: DocumentKind, batch_size: int = CLEANUP_BATCH_SIZE):
+    person = model.Person.__table__
+    legacy = person.c[f"document_{kind.value}"]
+    ref = person.c[f"document_{kind.value}_ref"]
+    cleared = 0
+    skipped = 0
+    last_id = None
+
+    while True:
+        query = select(person.c.id, ref).where(legacy != None, ref != None).order_by(person.c.id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(person.c.id > last_id)
+
+        rows = db.execute(query).fetchall()
+        if not rows:
+            break
+
+        verified = [row.id for row in rows if blob_store.verify(row[1])]
+        for row in rows:
+            if row.id not in verified:
+                print(f"Keeping document_{kind.value} of person {row.id}: blob {row[1]} is missing or corrupt")
+
+        if verified:
+            db.execute(update(person).where(person.c.id.in_(verified)).values({legacy: None}))
+            db.commit()
+
+        cleared += len(verified)
+        skipped += len(rows) - len(verified)
+        last_id = rows[-1].id
+
+    return cleared, skipped
+
+
+if __name__ == "__main__":
+    blob_store.check_store()
+    db = SessionLocal()
+    try:
+        for document_kind in DocumentKind:
+            cleared, skipped = clear_legacy_documents(db, document_kind)
+            print(f"document_{document_kind.value}: cleared {cleared}, kept {skipped}")
+    finally:
+        db.close()
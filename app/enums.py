@@ -11,3 +11,14 @@ class TestTest(str, Enum):
     test = "test"
     dev = "dev"
     prod = "prod"
+
+
+class DocumentKind(str, Enum):
+    front = "front"
+    back = "back"
+    verification_photo = "verification_photo"
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from itertools import groupby
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app import repository
+from app.enums import ExportFormat
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+COMPANY_FIELDS = ("id", "name", "id_number", "dic", "registry", "status", "created_at", "finstat_at")
+COMPANY_PERSON_FIELDS = ("person_id", "person_name", "person_surname", "person_email", "person_requested_at",
+                         "person_verified_at")
+PERSON_FIELDS = ("id", "name", "surname", "email", "country", "id_number", "document_type", "document_number",
+                 "created_at", "requested_at", "verified_at", "company_id", "company_name", "company_id_number")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    return str(value)
+
+
+def _ndjson_line(record):
+    return json.dumps(record, default=_json_default, ensure_ascii=False) + "\n"
+
+
+def _csv_lines(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(["" if value is None else _json_default(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+
+def _company_records(rows):
+    for _, company_rows in groupby(rows, key=lambda row: row.id):
+        company_rows = list(company_rows)
+        record = {field: getattr(company_rows[0], field) for field in COMPANY_FIELDS}
+        record["persons"] = [{
+            "id": row.person_id,
+            "name": row.person_name,
+            "surname": row.person_surname,
+            "email": row.person_email,
+            "requested_at": row.person_requested_at,
+            "verified_at": row.person_verified_at,
+        } for row in company_rows if row.person_id is not None]
+        yield record
+
+
+def iter_companies(db: Session, export_format: ExportFormat):
+    rows = repository.export_companies(db, EXPORT_BATCH_SIZE)
+
+    if export_format == ExportFormat.csv:
+        header = COMPANY_FIELDS + COMPANY_PERSON_FIELDS
+        yield from _csv_lines(header, ([getattr(row, field) for field in header] for row in rows))
+    else:
+        for record in _company_records(rows):
+            yield _ndjson_line(record)
+
+
+def iter_persons(db: Session, export_format: ExportFormat):
+    rows = repository.export_persons(db, EXPORT_BATCH_SIZE)
+
+    if export_format == ExportFormat.csv:
+        yield from _csv_lines(PERSON_FIELDS, ([getattr(row, field) for field in PERSON_FIELDS] for row in rows))
+    else:
+        for row in rows:
+            yield _ndjson_line({field: getattr(row, field) for field in PERSON_FIELDS})
+
+
+def export_response(rows, name: str, export_format: ExportFormat):
+    filename = f"{name}-{datetime.now():%Y%m%d}.{export_format.value}"
+
+    return StreamingResponse(rows, media_type=MEDIA_TYPES[export_format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
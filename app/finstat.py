@@ -1,23 +1,221 @@
+import asyncio
 import httpx
 import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from fastapi import HTTPException
 from hashlib import sha256
+from app import async_repository
 from app import schema
+from app.database import AsyncSessionLocal
+
+FINSTAT_API_URL = os.environ.get("FINSTAT_API_URL", "https://www.finstat.sk/api")
+FINSTAT_MAX_CONNECTIONS = int(os.environ.get("FINSTAT_MAX_CONNECTIONS", 20))
+FINSTAT_MAX_KEEPALIVE = int(os.environ.get("FINSTAT_MAX_KEEPALIVE", 10))
+FINSTAT_KEEPALIVE_EXPIRY = float(os.environ.get("FINSTAT_KEEPALIVE_EXPIRY", 30))
+FINSTAT_CONNECT_TIMEOUT = float(os.environ.get("FINSTAT_CONNECT_TIMEOUT", 5))
+FINSTAT_TIMEOUT = float(os.environ.get("FINSTAT_TIMEOUT", 10))
+FINSTAT_POOL_TIMEOUT = float(os.environ.get("FINSTAT_POOL_TIMEOUT", 5))
+FINSTAT_HTTP2 = os.environ.get("FINSTAT_HTTP2", "false").lower() in ("1", "true", "yes")
+FINSTAT_RETRIES = int(os.environ.get("FINSTAT_RETRIES", 2))
+FINSTAT_RETRY_BACKOFF = float(os.environ.get("FINSTAT_RETRY_BACKOFF", 0.5))
+FINSTAT_CACHE_TTL_SECONDS = float(os.environ.get("FINSTAT_CACHE_TTL_SECONDS", 24 * 60 * 60))
+FINSTAT_CACHE_STALE_SECONDS = float(os.environ.get("FINSTAT_CACHE_STALE_SECONDS", 7 * 24 * 60 * 60))
+FINSTAT_CACHE_SIZE = int(os.environ.get("FINSTAT_CACHE_SIZE", 1024))
+FINSTAT_MAX_CONCURRENCY = int(os.environ.get("FINSTAT_MAX_CONCURRENCY", 4))
+FINSTAT_BATCH_CONCURRENCY = int(os.environ.get("FINSTAT_BATCH_CONCURRENCY", 8))
+FINSTAT_BATCH_MAX_SIZE = int(os.environ.get("FINSTAT_BATCH_MAX_SIZE", 500))
+INVALID_ICO = "ICO Too short."
+
+
+class CompanyCache:
+    def __init__(self, size: int):
+        self.size = size
+        self._companies = OrderedDict()
+
+    def get(self, ico: str):
+        entry = self._companies.get(ico)
+        if entry is not None:
+            self._companies.move_to_end(ico)
+
+        return entry
+
+    def put(self, ico: str, data: dict, fetched_at: datetime):
+        entry = (convert_finstat_data_to_company(dict(data)), fetched_at)
+        self._companies[ico] = entry
+        self._companies.move_to_end(ico)
+        while len(self._companies) > self.size:
+            self._companies.popitem(last=False)
+
+        return entry
+
+    def clear(self):
+        self._companies.clear()
+
+
+company_cache = CompanyCache(FINSTAT_CACHE_SIZE)
+
+_client = None
+_semaphore = None
+_loads = {}
+_refreshes = {}
+
+
+def start_client():
+    global _client
+
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=FINSTAT_API_URL,
+            http2=FINSTAT_HTTP2,
+            limits=httpx.Limits(max_connections=FINSTAT_MAX_CONNECTIONS,
+                                max_keepalive_connections=FINSTAT_MAX_KEEPALIVE,
+                                keepalive_expiry=FINSTAT_KEEPALIVE_EXPIRY),
+            timeout=httpx.Timeout(FINSTAT_TIMEOUT, connect=FINSTAT_CONNECT_TIMEOUT, pool=FINSTAT_POOL_TIMEOUT),
+        )
+
+    return _client
+
+
+async def close_client():
+    global _client
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client():
+    return start_client() if _client is None else _client
+
+
+def get_semaphore():
+    global _semaphore
+
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(FINSTAT_MAX_CONCURRENCY)
+
+    return _semaphore
+
+
+async def _post(path: str, data: dict):
+    for attempt in range(FINSTAT_RETRIES + 1):
+        try:
+            async with get_semaphore():
+                result = await get_client().post(path, data=data)
+            if result.status_code < 500:
+                return result
+            error = f"status {result.status_code}"
+        except httpx.TransportError as e:
+            error = repr(e)
+
+        if attempt < FINSTAT_RETRIES:
+            await asyncio.sleep(FINSTAT_RETRY_BACKOFF * 2 ** attempt)
+
+    print(f"Finstat request {path} failed: {error}")
+    raise HTTPException(status_code=502, detail="Finstat is not available.")
+
+
+async def fetch_company_data(ico):
+    pub = os.environ['FINSTAT_PUBLIC_API_KEY']
+    private = os.environ['FINSTAT_PRIVATE_API_KEY']
+
+    result = await _post('/detail.json', data={
+        'Ico': ico,
+        'apiKey': pub,
+        'Hash': generate_hash_of_param_for_search_api(pub, private, ico)
+    })
+
+    return result.json()
+
+
+async def _refresh(ico: str):
+    data = await fetch_company_data(ico)
+    fetched_at = datetime.now(timezone.utc)
+    entry = company_cache.put(ico, data, fetched_at)
+    async with AsyncSessionLocal() as db:
+        await async_repository.save_finstat_cache(db, ico, data, fetched_at)
+        await async_repository.write_finstat_company_data(db, entry[0], fetched_at)
+
+    return entry
+
+
+async def _load(ico: str):
+    async with AsyncSessionLocal() as db:
+        cached = await async_repository.get_finstat_cache(db, ico)
+
+    return None if cached is None else company_cache.put(ico, cached.data, cached.fetched_at)
+
+
+def _flight_done(flights: dict, ico: str, task: asyncio.Task):
+    flights.pop(ico, None)
+
+    if not task.cancelled():
+        error = task.exception()
+        if error is not None and not isinstance(error, HTTPException):
+            print(f"Finstat lookup of {ico} failed: {error!r}")
+
+
+def _single_flight(flights: dict, ico: str, function):
+    task = flights.get(ico)
+
+    if task is None:
+        task = flights[ico] = asyncio.create_task(function(ico))
+        task.add_done_callback(lambda done: _flight_done(flights, ico, done))
+
+    return task
 
 
 async def find_company_by_ico(ico):
-    async with httpx.AsyncClient() as client:
-        pub = os.environ['FINSTAT_PUBLIC_API_KEY']
-        private = os.environ['FINSTAT_PRIVATE_API_KEY']
-
-        result = await client.post('https://www.finstat.sk/api/detail.json', headers={
-            'Content-Type': 'application/x-www-form-urlencoded'
-        }, data={
-            'Ico': ico,
-            'apiKey': pub,
-            'Hash': generate_hash_of_param_for_search_api(pub, private, ico)
-        })
-
-        return convert_finstat_data_to_company(result.json())
+    entry = company_cache.get(ico)
+
+    if entry is None:
+        entry = await asyncio.shield(_single_flight(_loads, ico, _load))
+
+    if entry is not None:
+        company, fetched_at = entry
+        age = (datetime.now(timezone.utc) - fetched_at).total_seconds()
+        if age < FINSTAT_CACHE_TTL_SECONDS:
+            return company
+        if age < FINSTAT_CACHE_TTL_SECONDS + FINSTAT_CACHE_STALE_SECONDS:
+            _single_flight(_refreshes, ico, _refresh)
+            return company
+
+    company, _ = await asyncio.shield(_single_flight(_refreshes, ico, _refresh))
+
+    return company
+
+
+async def _lookup(ico: str, semaphore: asyncio.Semaphore):
+    if not is_valid_ico(ico):
+        return {"ico": ico, "status_code": 400, "detail": INVALID_ICO}
+
+    try:
+        async with semaphore:
+            company = await find_company_by_ico(ico)
+    except HTTPException as e:
+        return {"ico": ico, "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        print(f"Finstat lookup of {ico} failed: {e!r}")
+        return {"ico": ico, "status_code": 500, "detail": "Finstat lookup failed."}
+
+    return {"ico": ico, "status_code": 200, "company": company.dict()}
+
+
+async def find_companies_by_ico(icos):
+    semaphore = asyncio.Semaphore(FINSTAT_BATCH_CONCURRENCY)
+    tasks = [asyncio.ensure_future(_lookup(ico, semaphore)) for ico in icos]
+
+    try:
+        for result in asyncio.as_completed(tasks):
+            yield await result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def is_valid_ico(ico: str):
+    return 6 <= len(ico) <= 8
 
 
 def generate_hash_seed(public_key, private_key, hashed_key_attribute):
@@ -0,0 +1,95 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", os.cpu_count() or 1))
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", HASH_WORKERS * 4))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+_executor = None
+_pending = 0
+
+
+def _hash(password: str):
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str):
+    return pwd_context.verify(password, hashed_password)
+
+
+def get_executor():
+    global _executor
+
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+    return _executor
+
+
+def shutdown():
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def _discard(executor: ProcessPoolExecutor):
+    global _executor
+
+    if _executor is executor:
+        _executor = None
+        executor.shutdown(wait=False)
+
+
+async def _submit(function, *args):
+    executor = get_executor()
+
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+    except BrokenProcessPool:
+        print("Password hashing pool is broken, starting a new one")
+        _discard(executor)
+        raise
+
+
+async def _run(function, *args):
+    global _pending
+
+    if _pending >= HASH_MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Too many password operations in progress.",
+                            headers={"Retry-After": "1"})
+
+    _pending += 1
+    try:
+        try:
+            return await _submit(function, *args)
+        except BrokenProcessPool:
+            pass
+
+        try:
+            return await _submit(function, *args)
+        except BrokenProcessPool:
+            raise HTTPException(status_code=503, detail="Password hashing is temporarily unavailable.",
+                                headers={"Retry-After": "1"})
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str):
+    return await _run(_hash, password)
+
+
+async def verify_password(password: str, hashed_password: str):
+    return await _run(_verify, password, hashed_password)
+
+
+def pending():
+    return _pending
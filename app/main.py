@@ -1,32 +1,49 @@
+import asyncio
 import os
 
+import orjson
+from anyio import to_thread
 from dotenv import load_dotenv
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import FileResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
 
 load_dotenv()
 
 from app.repository import add_system_user
 from app.user_service import user_management_service
-from app.auth_utils import get_current_user, create_access_token
-from datetime import datetime
-from typing import List
-from fastapi import Depends, FastAPI, HTTPException, Request, status
+from app.auth_utils import get_current_admin, get_current_user, create_access_token
+from typing import List, Optional, Union
+from fastapi import BackgroundTasks, Depends, FastAPI, File, HTTPException, Request, Response, UploadFile, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app import repository, deepfaceService
+from app import repository, async_repository, deepfaceService
+from app import blob_store
 from app import model
 from app import schema
 from app import finstat
-from app.database import engine, Base, get_db
+from app.database import engine, Base, get_db, get_async_db, get_read_db, stick_to_primary, SessionLocal, \
+    get_pool_status
 from fastapi.middleware.cors import CORSMiddleware
 from uuid import UUID
 from pydantic import EmailStr
 from app import email_sender
+from app import company_import
+from app import company_status
+from app import export
+from app import hashing
+from app import serializers
+from app.enums import DocumentKind, ExportFormat
+from app.pagination import decode_cursor, next_page_headers
+from app.suggest import company_index
+from app.user_cache import listen_for_user_changes
 
 Base.metadata.create_all(bind=engine)
 
+SUGGEST_MAX_LIMIT = 50
+
 
 add_system_user()
+blob_store.check_store()
 app = FastAPI(debug=eval(os.environ["BE_STACK_TRACE_ERROR"]))
 app.include_router(deepfaceService.app)
 app.include_router(user_management_service.app)
@@ -44,28 +61,65 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Link", "X-Next-Cursor"],
 )
 
 
-def authenticate_user(db, email: str, password: str):
-    user = repository.get_user_by_email_active(db, email)
+@app.on_event("startup")
+def build_company_suggest_index():
+    db = SessionLocal()
+    try:
+        company_index.build(db)
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+async def start_user_cache_listener():
+    app.state.user_cache_listener = asyncio.create_task(listen_for_user_changes())
+
+
+@app.on_event("shutdown")
+async def stop_user_cache_listener():
+    app.state.user_cache_listener.cancel()
+
+
+@app.on_event("shutdown")
+def stop_hashing_pool():
+    hashing.shutdown()
+
+
+@app.on_event("startup")
+def start_finstat_client():
+    finstat.start_client()
+
+
+@app.on_event("shutdown")
+async def stop_finstat_client():
+    await finstat.close_client()
+
+
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await async_repository.get_user_by_email_active(db, email)
     if user is None:
         return False
-    if not repository.verify_password(password, user.password):
+    if not await hashing.verify_password(password, user.password):
         return False
     return user
 
 
 @app.post("/token", response_model=schema.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(),
+                                 db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if user is False:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.email})
+    access_token = create_access_token(data={"sub": user.email, "uid": str(user.id), "act": user.active,
+                                             "ver": user.token_version})
 
     return {"access_token": access_token, "token_type": "bearer", "id": user.id, "email": user.email, "name": user.name, "surname": user.surname, "active": user.active}
 
@@ -75,7 +129,17 @@ def alive(request: Request):
     return {"message": "Server is online", "root_path": request.scope.get("root_path")}
 
 
-@app.post("/company", response_model=schema.Company)
+@app.get("/admin/pool")
+async def read_pool_status(current_user: model.User = Depends(get_current_admin)):
+    limiter = to_thread.current_default_thread_limiter()
+
+    return {
+        "pools": get_pool_status(),
+        "threadpool": {"total_tokens": limiter.total_tokens, "borrowed_tokens": limiter.borrowed_tokens},
+    }
+
+
+@app.post("/company", response_model=schema.Company, dependencies=[Depends(stick_to_primary)])
 def create_company(company: schema.CompanyBase, db: Session = Depends(get_db),
                    current_user: model.User = Depends(get_current_user)):
     db_company = repository.get_company_by_id_number(db, id_number=company.id_number)
@@ -84,64 +148,89 @@ def create_company(company: schema.CompanyBase, db: Session = Depends(get_db),
     return repository.create_company(db=db, company=company)
 
 
-@app.get("/company", response_model=List[schema.Company])
-def read_companies(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
+@app.post("/company/import", response_model=List[schema.CompanyImportResult],
+          dependencies=[Depends(stick_to_primary)])
+async def import_companies(request: Request, background_tasks: BackgroundTasks,
+                           db: AsyncSession = Depends(get_async_db),
+                           current_user: model.User = Depends(get_current_user)):
+    results = await company_import.import_companies(db, request)
+    created_ids = [result["id"] for result in results if result["status"] == "created"]
+
+    if created_ids:
+        background_tasks.add_task(repository.scrape_persons_for_companies, created_ids)
+
+    return results
+
+
+@app.get("/company", response_model=Union[List[schema.Company], List[schema.CompanySummary]])
+def read_companies(request: Request, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                   fields: Optional[str] = None, include: Optional[str] = None, db: Session = Depends(get_read_db),
                    current_user: model.User = Depends(get_current_user)):
-    return repository.get_companies(db, skip=skip, limit=limit)
+    fields, include = serializers.parse_view(fields, include, serializers.COMPANY_FIELDS,
+                                             repository.COMPANY_RELATIONS)
+    companies = repository.get_companies(db, skip=skip, limit=limit, after=decode_cursor(cursor), fields=fields)
+
+    return ORJSONResponse(serializers.company_dicts(db, companies, fields, include),
+                          headers=next_page_headers(request, companies, limit))
 
 
 @app.get("/company/{company_id}", response_model=schema.Company)
-def read_company(company_id: UUID, db: Session = Depends(get_db), current_user: model.User = Depends(get_current_user)):
-    db_company = repository.get_company(db, company_id=company_id)
+def read_company(company_id: UUID, db: Session = Depends(get_read_db), current_user: model.User = Depends(get_current_user)):
+    db_company = repository.get_company(db, company_id=company_id, with_relations=True)
     if db_company is None:
         raise HTTPException(status_code=404, detail="Company not found.")
     return db_company
 
 
 @app.get("/company/{company_id}/address", response_model=List[schema.Address])
-def get_company_addresses(company_id: UUID, db: Session = Depends(get_db),
+def get_company_addresses(company_id: UUID, db: Session = Depends(get_read_db),
                           current_user: model.User = Depends(get_current_user)):
     return repository.get_addresses_by_company(db=db, company_id=company_id)
 
 
-@app.get("/company/{company_id}/aml", response_class=PlainTextResponse)
+@app.get("/company/{company_id}/aml", response_class=PlainTextResponse, dependencies=[Depends(stick_to_primary)])
 def get_company_aml(company_id: UUID, db: Session = Depends(get_db),
                           current_user: model.User = Depends(get_current_user)):
+    if company_status.apply(db, company_status.aml_completed(company_id)):
+        db.commit()
+        return "OK"
+
     db_company = repository.get_company(db, company_id=company_id)
     if db_company is None:
         raise HTTPException(status_code=404, detail="Company not found.")
 
-    if db_company.status == 1:
+    if db_company.status == company_status.NEW:
         raise HTTPException(status_code=404, detail="Company can not complete AML procedure without beneficiaries.")
 
-    if db_company.status == 2:
-        db_company.status = 3
-        db.commit()
-
     return "OK"
 
 
-@app.post("/person", response_model=schema.Person)
+@app.post("/person", response_model=schema.Person, dependencies=[Depends(stick_to_primary)])
 def create_person(person: schema.PersonCreate, db: Session = Depends(get_db),
                   current_user: model.User = Depends(get_current_user)):
     return repository.create_person(db=db, person=person)
 
 
-@app.get("/person", response_model=List[schema.Person])
-def read_persons(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
+@app.get("/person", response_model=Union[List[schema.Person], List[schema.PersonSummary]])
+def read_persons(request: Request, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                 fields: Optional[str] = None, include: Optional[str] = None, db: Session = Depends(get_read_db),
                  current_user: model.User = Depends(get_current_user)):
-    return repository.get_persons(db, skip=skip, limit=limit)
+    fields, include = serializers.parse_view(fields, include, serializers.PERSON_FIELDS, serializers.PERSON_RELATIONS)
+    persons = repository.get_persons(db, skip=skip, limit=limit, after=decode_cursor(cursor), fields=fields)
+
+    return ORJSONResponse(serializers.person_dicts(db, persons, fields, include),
+                          headers=next_page_headers(request, persons, limit))
 
 
 @app.get("/person/{person_id}", response_model=schema.Person)
-def read_person(person_id: UUID, db: Session = Depends(get_db), current_user: model.User = Depends(get_current_user)):
+def read_person(person_id: UUID, db: Session = Depends(get_read_db), current_user: model.User = Depends(get_current_user)):
     db_person = repository.get_person(db, person_id=person_id)
     if db_person is None:
         raise HTTPException(status_code=404, detail="Person not found.")
     return db_person
 
 
-@app.post("/person/{person_id}/update", response_model=schema.Person)
+@app.post("/person/{person_id}/update", response_model=schema.Person, dependencies=[Depends(stick_to_primary)])
 def update_person(person_id: UUID, person: schema.PersonUpdate, db: Session = Depends(get_db),
                   current_user: model.User = Depends(get_current_user)):
     db_person = repository.update_person(db=db, person_id=person_id, person=person)
@@ -152,7 +241,7 @@ def update_person(person_id: UUID, person: schema.PersonUpdate, db: Session = De
     return db_person
 
 
-@app.delete("/person/{person_id}/delete", response_class=PlainTextResponse)
+@app.delete("/person/{person_id}/delete", response_class=PlainTextResponse, dependencies=[Depends(stick_to_primary)])
 def delete_person(person_id: UUID, db: Session = Depends(get_db), current_user: model.User = Depends(get_current_user)):
     db_person = repository.get_person(db, person_id=person_id)
 
@@ -165,20 +254,67 @@ def delete_person(person_id: UUID, db: Session = Depends(get_db), current_user:
 
 
 @app.get("/person/{person_id}/address", response_model=List[schema.Address])
-def get_person_addresses(person_id: UUID, db: Session = Depends(get_db),
+def get_person_addresses(person_id: UUID, db: Session = Depends(get_read_db),
                          current_user: model.User = Depends(get_current_user)):
     return repository.get_addresses_by_person(db=db, person_id=person_id)
 
+
+@app.put("/person/{person_id}/document/{kind}", response_model=schema.PersonDocument,
+         dependencies=[Depends(stick_to_primary)])
+def upload_person_document(person_id: UUID, kind: DocumentKind, document: UploadFile = File(...),
+                           db: Session = Depends(get_db), current_user: model.User = Depends(get_current_user)):
+    db_person = repository.get_person(db, person_id=person_id)
+
+    if db_person is None:
+        raise HTTPException(status_code=404, detail="Person not found.")
+
+    ref, size = blob_store.put_file(document.file)
+    repository.set_person_document(db, db_person, kind, ref)
+
+    return schema.PersonDocument(kind=kind, ref=ref, size=size)
+
+
+@app.get("/person/{person_id}/document/{kind}")
+def download_person_document(person_id: UUID, kind: DocumentKind, db: Session = Depends(get_read_db),
+                             current_user: model.User = Depends(get_current_user)):
+    db_person = repository.get_person(db, person_id=person_id)
+
+    if db_person is None:
+        raise HTTPException(status_code=404, detail="Person not found.")
+
+    ref = getattr(db_person, f"document_{kind.value}_ref")
+    if blob_store.exists(ref):
+        return FileResponse(blob_store.blob_path(ref), media_type=blob_store.file_media_type(ref))
+
+    legacy = repository.get_person_legacy_document(db, person_id, kind)
+    if legacy:
+        # Legacy columns were stored before uploads were validated, serve them as they were
+        data = blob_store.decode_base64(legacy, validate=False)
+        return Response(content=data, media_type=blob_store.media_type(data))
+
+    raise HTTPException(status_code=404, detail="Document not found.")
+
 @app.get("/finstat/company/{ico}", response_model=schema.FinstatCompany)
 async def get_company_finstat_data(ico: str, current_user: model.User = Depends(get_current_user)):
-    if len(ico) < 6 or len(ico) > 8:
-        raise HTTPException(status_code=400, detail="ICO Too short.")
+    if not finstat.is_valid_ico(ico):
+        raise HTTPException(status_code=400, detail=finstat.INVALID_ICO)
 
     return await finstat.find_company_by_ico(ico)
 
 
+@app.post("/finstat/companies")
+async def get_companies_finstat_data(batch: schema.FinstatIcoList,
+                                     current_user: model.User = Depends(get_current_user)):
+    if len(batch.icos) > finstat.FINSTAT_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {finstat.FINSTAT_BATCH_MAX_SIZE} ICOs per request.")
+
+    rows = (orjson.dumps(row) + b"\n" async for row in finstat.find_companies_by_ico(batch.icos))
+
+    return StreamingResponse(rows, media_type="application/x-ndjson")
+
+
 @app.get("/app/check/{person_id}", response_model=schema.PersonCheck)
-def check_person_for_app(person_id: UUID, db: Session = Depends(get_db)):
+def check_person_for_app(person_id: UUID, db: Session = Depends(get_read_db)):
     db_person = repository.get_person(db, person_id=person_id)
 
     if db_person is None:
@@ -204,25 +340,26 @@ def check_person_for_app(person_id: UUID, db: Session = Depends(get_db)):
     return person_check
 
 
-@app.post("/app/verify", response_model=schema.Person)
-async def verify_person(person: schema.PersonVerify, db: Session = Depends(get_db)):
-    db_person = repository.get_person(db, person.id)
+@app.post("/app/verify", response_model=schema.Person, dependencies=[Depends(stick_to_primary)])
+async def verify_person(person: schema.PersonVerify, db: AsyncSession = Depends(get_async_db)):
+    db_person = await async_repository.get_person(db, person.id)
     if not db_person:
         raise HTTPException(status_code=404, detail="Person with specified ID does not exist!")
 
     if db_person.verified_at is not None:
         raise HTTPException(status_code=403, detail="Person already verified!")
 
-    person = repository.verify_person(db=db, db_person=db_person, person=person)
+    person = await async_repository.verify_person(db=db, db_person=db_person, person=person)
     await email_sender.send_verification_confirm_mail(db_person.email)
 
     return person
 
 
-@app.get("/person/request/{person_id}/{language}", response_class=PlainTextResponse)
-async def request_verification(person_id: UUID, language: str, db: Session = Depends(get_db),
+@app.get("/person/request/{person_id}/{language}", response_class=PlainTextResponse,
+         dependencies=[Depends(stick_to_primary)])
+async def request_verification(person_id: UUID, language: str, db: AsyncSession = Depends(get_async_db),
                                current_user: model.User = Depends(get_current_user)):
-    db_person = repository.get_person(db, person_id=person_id)
+    db_person = await async_repository.get_person(db, person_id=person_id)
     if db_person is None:
         raise HTTPException(status_code=404, detail="Person not found.")
 
@@ -234,31 +371,35 @@ async def request_verification(person_id: UUID, language: str, db: Session = Dep
     return
 
 
-@app.get("/person/request/all/{company_id}/{language}", response_class=PlainTextResponse)
-async def request_verification_by_all_company_persons(company_id: UUID, language: str, db: Session = Depends(get_db),
+@app.get("/person/request/all/{company_id}/{language}", response_class=PlainTextResponse,
+         dependencies=[Depends(stick_to_primary)])
+async def request_verification_by_all_company_persons(company_id: UUID, language: str,
+                                                      db: AsyncSession = Depends(get_async_db),
                                                       current_user: model.User = Depends(get_current_user)):
-    db_company = repository.get_company(db, company_id=company_id)
+    db_company = await async_repository.get_company(db, company_id=company_id)
     if db_company is None:
         raise HTTPException(status_code=404, detail="Company not found.")
 
-    for db_person in db_company.persons:
+    for db_person in await async_repository.get_persons_by_company(db, company_id=company_id):
         if db_person.verified_at is None:
             await send_kyc_email(db_person, language, db)
 
     return
 
 
-@app.post("/person/request/persons/{company_id}/{language}", response_class=PlainTextResponse)
+@app.post("/person/request/persons/{company_id}/{language}", response_class=PlainTextResponse,
+          dependencies=[Depends(stick_to_primary)])
 async def request_verification_by_company_and_persons(company_id: UUID, language: str,
                                                       company_persons: schema.PersonsUUIDList,
-                                                      db: Session = Depends(get_db),
+                                                      db: AsyncSession = Depends(get_async_db),
                                                       current_user: model.User = Depends(get_current_user)):
-    db_company = repository.get_company(db, company_id=company_id)
+    db_company = await async_repository.get_company(db, company_id=company_id)
     if db_company is None:
         raise HTTPException(status_code=404, detail="Company not found.")
 
     for person_id in company_persons.persons:
-        db_person = repository.get_person_by_company_and_id(db, company_id=company_id, person_id=person_id)
+        db_person = await async_repository.get_person_by_company_and_id(db, company_id=company_id,
+                                                                        person_id=person_id)
         if db_person is not None and db_person.verified_at is None:
             await send_kyc_email(db_person, language, db)
 
@@ -270,16 +411,10 @@ async def send_kyc_email(db_person, language, db):
     body = {"link": 'http://pumec.zapto.org:8080/login?token=' + str(db_person.id)}
     email = schema.EmailSchema(email=email_str, body=body)
     await email_sender.send_email_async('KYC identification', email, template_name='email_kyc_' + language + '.html')
-    db_person.requested_at = datetime.now()
-    db.commit()
-    db.refresh(db_person)
-    company = repository.get_company(db,db_person.company_id)
-    if company.status == 3:
-        company.status = 4
-    db.commit()
+    await async_repository.mark_person_requested(db, db_person)
 
 
-@app.post("/beneficiary", response_model=schema.Beneficiary)
+@app.post("/beneficiary", response_model=schema.Beneficiary, dependencies=[Depends(stick_to_primary)])
 def create_beneficiary(beneficiary: schema.BeneficiaryBase, db: Session = Depends(get_db)):
     db_beneficiary = repository.get_beneficiary_by_name_surname_company(db, beneficiary.name, beneficiary.surname,
                                                                         beneficiary.company_id)
@@ -291,13 +426,16 @@ def create_beneficiary(beneficiary: schema.BeneficiaryBase, db: Session = Depend
 
 
 @app.get("/beneficiary", response_model=List[schema.Beneficiary])
-def read_beneficiaries(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
-                       current_user: model.User = Depends(get_current_user)):
-    return repository.get_beneficiaries(db, skip=skip, limit=limit)
+def read_beneficiaries(request: Request, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+                       db: Session = Depends(get_read_db), current_user: model.User = Depends(get_current_user)):
+    beneficiaries = repository.get_beneficiaries(db, skip=skip, limit=limit, after=decode_cursor(cursor))
+
+    return ORJSONResponse([serializers.beneficiary_dict(beneficiary) for beneficiary in beneficiaries],
+                          headers=next_page_headers(request, beneficiaries, limit))
 
 
 @app.get("/beneficiary/{beneficiary_id}", response_model=schema.Beneficiary)
-def read_beneficiary(beneficiary_id: UUID, db: Session = Depends(get_db), current_user: model.User = Depends(
+def read_beneficiary(beneficiary_id: UUID, db: Session = Depends(get_read_db), current_user: model.User = Depends(
     get_current_user)):
     db_beneficiary = repository.get_beneficiary(db, beneficiary_id=beneficiary_id)
 
@@ -307,7 +445,8 @@ def read_beneficiary(beneficiary_id: UUID, db: Session = Depends(get_db), curren
     return db_beneficiary
 
 
-@app.delete("/beneficiary/{beneficiary_id}/delete", response_class=PlainTextResponse)
+@app.delete("/beneficiary/{beneficiary_id}/delete", response_class=PlainTextResponse,
+            dependencies=[Depends(stick_to_primary)])
 def delete_beneficiary(beneficiary_id: UUID, db: Session = Depends(get_db), current_user: model.User = Depends(
     get_current_user)):
     db_beneficiary = repository.get_beneficiary(db, beneficiary_id=beneficiary_id)
@@ -320,14 +459,36 @@ def delete_beneficiary(beneficiary_id: UUID, db: Session = Depends(get_db), curr
     return
 
 
-@app.get("/search", response_model=List[schema.Company])
-def search_companies(q: str, db: Session = Depends(get_db),
+@app.get("/search/suggest", response_model=List[schema.CompanySuggestion])
+def suggest_companies(q: str, limit: int = 10, current_user: model.User = Depends(get_current_user)):
+    if not q:
+        raise HTTPException(status_code=400, detail="You must specify q url parameter in order to suggest companies.")
+
+    return company_index.suggest(q, limit=min(limit, SUGGEST_MAX_LIMIT))
+
+
+@app.get("/search", response_model=Union[List[schema.Company], List[schema.CompanySummary]])
+def search_companies(q: str, skip: int = 0, limit: int = 50, fields: Optional[str] = None,
+                     include: Optional[str] = None, db: Session = Depends(get_read_db),
                      current_user: model.User = Depends(get_current_user)):
     if not q:
         raise HTTPException(status_code=400, detail="You must specify q url parameter in order to search companies.")
 
-    companies = repository.search_companies(db, q)
-    companies_by_persons = repository.search_companies_by_persons(db, q)
-    companies_by_beneficiaries = repository.search_companies_by_beneficiaries(db, q)
+    fields, include = serializers.parse_view(fields, include, serializers.COMPANY_FIELDS,
+                                             repository.COMPANY_RELATIONS)
+    companies = repository.search_companies(db, q, skip=skip, limit=min(limit, repository.SEARCH_MAX_LIMIT),
+                                            fields=fields)
+
+    return ORJSONResponse(serializers.company_dicts(db, companies, fields, include))
 
-    return list(set(companies + companies_by_persons + companies_by_beneficiaries))
+
+@app.get("/export/companies")
+def export_companies(format: ExportFormat = ExportFormat.ndjson, db: Session = Depends(get_read_db),
+                     current_user: model.User = Depends(get_current_user)):
+    return export.export_response(export.iter_companies(db, format), "companies", format)
+
+
+@app.get("/export/persons")
+def export_persons(format: ExportFormat = ExportFormat.ndjson, db: Session = Depends(get_read_db),
+                   current_user: model.User = Depends(get_current_user)):
+    return export.export_response(export.iter_persons(db, format), "persons", format)
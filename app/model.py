@@ -1,7 +1,8 @@
-from sqlalchemy import Column, ForeignKey, String, DateTime, func, Integer, Text, Boolean
+from sqlalchemy import Column, ForeignKey, String, DateTime, func, Integer, Text, Boolean, Index, text
 from sqlalchemy.dialects import postgresql
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship, validates
 from app.database import Base
+from app.normalization import normalize_text, normalize_digits, normalize_full_name
 import uuid
 
 
@@ -13,9 +14,9 @@ class Address(Base):
     street = Column(String)
     number = Column(String)
     zip = Column(String)
-    company_id = Column(postgresql.UUID(as_uuid=True), ForeignKey('company.id'), nullable=True)
+    company_id = Column(postgresql.UUID(as_uuid=True), ForeignKey('company.id'), nullable=True, index=True)
     company = relationship("Company", back_populates="addresses")
-    person_id = Column(postgresql.UUID(as_uuid=True), ForeignKey('person.id'), nullable=True)
+    person_id = Column(postgresql.UUID(as_uuid=True), ForeignKey('person.id'), nullable=True, index=True)
     person = relationship("Person", back_populates="address")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -27,7 +28,7 @@ class Company(Base):
     id = Column(postgresql.UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4)
     name = Column(String, unique=True, index=True)
     addresses = relationship("Address", back_populates="company", cascade="all, delete")
-    id_number = Column(String)
+    id_number = Column(String, unique=True, index=True)
     dic = Column(String)
     registry = Column(String)
     statute = Column(String)
@@ -37,6 +38,37 @@ class Company(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     finstat_at = Column(DateTime(timezone=True), nullable=True)
     status = Column(Integer, default=1)
+    persons_active = Column(Integer, nullable=False, default=0, server_default=text('0'))
+    persons_verified = Column(Integer, nullable=False, default=0, server_default=text('0'))
+    beneficiaries_active = Column(Integer, nullable=False, default=0, server_default=text('0'))
+    search_name = Column(String)
+    search_id_number = Column(String)
+    search_dic = Column(String)
+
+    __table_args__ = (
+        Index('ix_company_search_name_trgm', 'search_name', postgresql_using='gin',
+              postgresql_ops={'search_name': 'gin_trgm_ops'}),
+        Index('ix_company_search_id_number_trgm', 'search_id_number', postgresql_using='gin',
+              postgresql_ops={'search_id_number': 'gin_trgm_ops'}),
+        Index('ix_company_search_dic_trgm', 'search_dic', postgresql_using='gin',
+              postgresql_ops={'search_dic': 'gin_trgm_ops'}),
+        Index('ix_company_created_at_id', 'created_at', 'id'),
+    )
+
+    @validates('name')
+    def _normalize_name(self, key, value):
+        self.search_name = normalize_text(value)
+        return value
+
+    @validates('id_number')
+    def _normalize_id_number(self, key, value):
+        self.search_id_number = normalize_digits(value)
+        return value
+
+    @validates('dic')
+    def _normalize_dic(self, key, value):
+        self.search_dic = normalize_digits(value)
+        return value
 
 
 class Person(Base):
@@ -50,17 +82,49 @@ class Person(Base):
     id_number = Column(String)
     document_type = Column(String)
     document_number = Column(String)
-    document_front = Column(Text)
-    document_back = Column(Text)
-    document_verification_photo = Column(Text)
+    document_front = deferred(Column(Text), group="documents")
+    document_back = deferred(Column(Text), group="documents")
+    document_verification_photo = deferred(Column(Text), group="documents")
+    document_front_ref = Column(String(64), nullable=True)
+    document_back_ref = Column(String(64), nullable=True)
+    document_verification_photo_ref = Column(String(64), nullable=True)
     address = relationship("Address", back_populates="person", cascade="all, delete")
-    company_id = Column(postgresql.UUID(as_uuid=True), ForeignKey('company.id'))
+    company_id = Column(postgresql.UUID(as_uuid=True), ForeignKey('company.id'), index=True)
     company = relationship("Company", back_populates="persons")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     requested_at = Column(DateTime(timezone=True), nullable=True)
     verified_at = Column(DateTime(timezone=True), nullable=True)
     deleted_at = Column(DateTime(timezone=True), nullable=True)
+    search_name = Column(String)
+    search_email = Column(String)
+    search_id_number = Column(String)
+
+    __table_args__ = (
+        Index('ix_person_search_trgm', 'search_name', 'search_email', 'search_id_number', postgresql_using='gin',
+              postgresql_ops={'search_name': 'gin_trgm_ops', 'search_email': 'gin_trgm_ops',
+                              'search_id_number': 'gin_trgm_ops'},
+              postgresql_where=text('deleted_at IS NULL')),
+        Index('ix_person_created_at_id', 'created_at', 'id', postgresql_where=text('deleted_at IS NULL')),
+        Index('ix_person_id_number_active', 'id_number', postgresql_where=text('deleted_at IS NULL')),
+    )
+
+    @validates('name', 'surname')
+    def _normalize_name(self, key, value):
+        name = value if key == 'name' else self.name
+        surname = value if key == 'surname' else self.surname
+        self.search_name = normalize_full_name(name, surname)
+        return value
+
+    @validates('email')
+    def _normalize_email(self, key, value):
+        self.search_email = normalize_text(value)
+        return value
+
+    @validates('id_number')
+    def _normalize_id_number(self, key, value):
+        self.search_id_number = normalize_digits(value)
+        return value
 
 
 class Beneficiary(Base):
@@ -69,11 +133,28 @@ class Beneficiary(Base):
     id = Column(postgresql.UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4)
     name = Column(String)
     surname = Column(String)
-    company_id = Column(postgresql.UUID(as_uuid=True), ForeignKey('company.id'))
+    company_id = Column(postgresql.UUID(as_uuid=True), ForeignKey('company.id'), index=True)
     company = relationship("Company", back_populates="beneficiaries")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     deleted_at = Column(DateTime(timezone=True), nullable=True)
+    search_name = Column(String)
+
+    __table_args__ = (
+        Index('ix_beneficiary_search_trgm', 'search_name', postgresql_using='gin',
+              postgresql_ops={'search_name': 'gin_trgm_ops'},
+              postgresql_where=text('deleted_at IS NULL')),
+        Index('ix_beneficiary_created_at_id', 'created_at', 'id', postgresql_where=text('deleted_at IS NULL')),
+        Index('ix_beneficiary_company_id_name_surname_active', 'company_id', 'name', 'surname',
+              postgresql_where=text('deleted_at IS NULL')),
+    )
+
+    @validates('name', 'surname')
+    def _normalize_name(self, key, value):
+        name = value if key == 'name' else self.name
+        surname = value if key == 'surname' else self.surname
+        self.search_name = normalize_full_name(name, surname)
+        return value
 
 
 class User(Base):
@@ -82,19 +163,32 @@ class User(Base):
     id = Column(postgresql.UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4)
     name = Column(String, nullable=True)
     surname = Column(String, nullable=True)
-    email = Column(String)
+    email = Column(String, unique=True, index=True)
     password = Column(Text)
     active = Column(Boolean)
+    token_version = Column(Integer, nullable=False, default=0, server_default=text('0'))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     reset_tokens = relationship("ResetToken", back_populates="user")
 
+    __table_args__ = (
+        Index('ix_user_created_at_id', 'created_at', 'id'),
+    )
+
 
 class ResetToken(Base):
     __tablename__ = "reset_token"
 
     token = Column(postgresql.UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4)
-    user_id = Column(postgresql.UUID(as_uuid=True), ForeignKey('user.id'))
+    user_id = Column(postgresql.UUID(as_uuid=True), ForeignKey('user.id'), index=True)
     user = relationship("User", back_populates="reset_tokens")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     used_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class FinstatCache(Base):
+    __tablename__ = "finstat_cache"
+
+    ico = Column(String, primary_key=True)
+    data = Column(postgresql.JSONB, nullable=False)
+    fetched_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -0,0 +1,32 @@
+import re
+import unicodedata
+
+
+def normalize_text(value):
+    if value is None:
+        return None
+
+    decomposed = unicodedata.normalize('NFKD', value)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+    return ' '.join(stripped.lower().split())
+
+
+def normalize_digits(value):
+    if value is None:
+        return None
+
+    return re.sub(r'\D', '', value)
+
+
+def normalize_numeric_query(value):
+    text = normalize_text(value)
+
+    if text and text.replace(' ', '').isdigit():
+        return normalize_digits(text)
+
+    return None
+
+
+def normalize_full_name(name, surname):
+    return normalize_text(' '.join(part for part in (name, surname) if part)) or None
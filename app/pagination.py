@@ -0,0 +1,35 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from uuid import UUID
+
+from fastapi import HTTPException, Request
+
+
+def encode_cursor(created_at: datetime, row_id: UUID):
+    raw = json.dumps([created_at.isoformat(), str(row_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    if cursor is None:
+        return None
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), UUID(row_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def next_page_headers(request: Request, rows, limit: int):
+    if not rows or len(rows) < limit:
+        return {}
+
+    last = rows[-1]
+    cursor = encode_cursor(last.created_at, last.id)
+    url = request.url.remove_query_params('skip').include_query_params(cursor=cursor)
+
+    return {"Link": f'<{url}>; rel="next"', "X-Next-Cursor": cursor}
@@ -1,18 +1,47 @@
 import os
+import uuid
 from datetime import datetime
+from typing import List, Tuple
 from uuid import UUID
 
-from passlib.context import CryptContext
+from sqlalchemy import func, insert, select, tuple_, union_all, update
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 
+from app import blob_store
+from app import company_status
 from app import model
 from app import schema
-from app.database import get_db
+from app.database import get_db, SessionLocal
+from app.enums import DocumentKind
+from app.hashing import pwd_context
+from app.normalization import normalize_text, normalize_full_name, normalize_numeric_query
 from app.or_scraper.scraper import get_names
-from app.user_service.schema_user import UserCreate, User
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.suggest import company_index
+from app.user_cache import bump_token_version, notify_user_changed, token_versions, user_cache
+from app.user_service.schema_user import UserCreate
+
+SEARCH_MAX_LIMIT = 100
+
+COMPANY_COLUMNS = (
+    model.Company.id, model.Company.id_number, model.Company.dic, model.Company.name, model.Company.registry,
+    model.Company.status, model.Company.persons_active, model.Company.persons_verified,
+    model.Company.beneficiaries_active, model.Company.created_at,
+)
+ADDRESS_COLUMNS = (
+    model.Address.id, model.Address.city, model.Address.street, model.Address.number, model.Address.zip,
+)
+PERSON_COLUMNS = (
+    model.Person.id, model.Person.company_id, model.Person.email, model.Person.name, model.Person.surname,
+    model.Person.country, model.Person.id_number, model.Person.document_type, model.Person.document_number,
+    model.Person.created_at, model.Person.updated_at, model.Person.requested_at, model.Person.verified_at,
+    model.Person.deleted_at,
+)
+BENEFICIARY_COLUMNS = (
+    model.Beneficiary.id, model.Beneficiary.company_id, model.Beneficiary.name, model.Beneficiary.surname,
+    model.Beneficiary.created_at, model.Beneficiary.updated_at, model.Beneficiary.deleted_at,
+)
+COMPANY_RELATIONS = ('addresses', 'persons', 'beneficiaries')
 
 
 def get_address(db: Session, address_id: UUID):
@@ -45,16 +74,101 @@ def get_addresses_by_company(db: Session, company_id: UUID):
     return db.query(model.Address).filter(model.Address.company_id == company_id).all()
 
 
-def get_company(db: Session, company_id: UUID) -> model.Company:
-    return db.query(model.Company).filter(model.Company.id == company_id).first()
+def company_relations_options():
+    return (
+        selectinload(model.Company.addresses),
+        selectinload(model.Company.persons.and_(model.Person.deleted_at == None)),
+        selectinload(model.Company.beneficiaries.and_(model.Beneficiary.deleted_at == None)),
+    )
+
+
+def get_company(db: Session, company_id: UUID, with_relations: bool = False) -> model.Company:
+    query = db.query(model.Company)
+
+    if with_relations:
+        query = query.options(*company_relations_options())
+
+    return query.filter(model.Company.id == company_id).first()
+
+
+def company_counters_update(company_id: UUID, **deltas):
+    return update(model.Company).where(model.Company.id == company_id).values(
+        {getattr(model.Company, name): getattr(model.Company, name) + delta for name, delta in deltas.items()}
+    ).execution_options(synchronize_session="fetch")
+
+
+def person_verified_update(person_id: UUID):
+    # Only the first of concurrent verifications gets a row back, the rest must not bump the counters again
+    return update(model.Person).where(model.Person.id == person_id, model.Person.verified_at == None) \
+        .values(verified_at=datetime.now()).returning(model.Person.id).execution_options(synchronize_session=False)
 
 
 def get_company_by_id_number(db: Session, id_number: str):
     return db.query(model.Company).filter(model.Company.id_number == id_number).first()
 
 
-def get_companies(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(model.Company).offset(skip).limit(limit).all()
+def paginate(query, entity, skip: int = 0, limit: int = 100, after=None):
+    query = query.order_by(entity.created_at, entity.id)
+
+    if after is not None:
+        query = query.filter(tuple_(entity.created_at, entity.id) > tuple_(*after))
+    else:
+        query = query.offset(skip)
+
+    return query.limit(limit).all()
+
+
+def project(columns, fields=None):
+    if fields is None:
+        return columns
+
+    return tuple(column for column in columns if column.key in ('id', 'created_at') or column.key in fields)
+
+
+def get_companies(db: Session, skip: int = 0, limit: int = 100, after=None, fields=None):
+    return paginate(db.query(*project(COMPANY_COLUMNS, fields)), model.Company, skip=skip, limit=limit, after=after)
+
+
+def _group_by(rows, key: str):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(getattr(row, key), []).append(row)
+
+    return grouped
+
+
+def get_company_relations(db: Session, company_ids, include=COMPANY_RELATIONS):
+    relations = {}
+
+    if not company_ids:
+        return {relation: {} for relation in include}
+
+    if 'addresses' in include:
+        relations['addresses'] = _group_by(db.query(model.Address.company_id, *ADDRESS_COLUMNS)
+                                           .filter(model.Address.company_id.in_(company_ids))
+                                           .order_by(model.Address.created_at, model.Address.id).all(), 'company_id')
+    if 'persons' in include:
+        relations['persons'] = _group_by(db.query(*PERSON_COLUMNS)
+                                         .filter(model.Person.company_id.in_(company_ids),
+                                                 model.Person.deleted_at == None)
+                                         .order_by(model.Person.created_at, model.Person.id).all(), 'company_id')
+    if 'beneficiaries' in include:
+        relations['beneficiaries'] = _group_by(db.query(*BENEFICIARY_COLUMNS)
+                                               .filter(model.Beneficiary.company_id.in_(company_ids),
+                                                       model.Beneficiary.deleted_at == None)
+                                               .order_by(model.Beneficiary.created_at, model.Beneficiary.id).all(),
+                                               'company_id')
+
+    return relations
+
+
+def get_person_addresses(db: Session, person_ids):
+    if not person_ids:
+        return {}
+
+    return _group_by(db.query(model.Address.person_id, *ADDRESS_COLUMNS)
+                     .filter(model.Address.person_id.in_(person_ids))
+                     .order_by(model.Address.created_at, model.Address.id).all(), 'person_id')
 
 
 def create_company(db: Session, company: schema.CompanyBase):
@@ -73,6 +187,7 @@ def create_company(db: Session, company: schema.CompanyBase):
     db.add(db_company)
     db.commit()
     db.refresh(db_company)
+    company_index.add(db_company)
     scrape_persons_for_company(db, db_company)
 
     return db_company
@@ -82,12 +197,21 @@ def get_person(db: Session, person_id: UUID) -> model.Person:
     return db.query(model.Person).filter(model.Person.id == person_id, model.Person.deleted_at == None).first()
 
 
+def get_person_legacy_document(db: Session, person_id: UUID, kind: DocumentKind):
+    return db.query(getattr(model.Person, f"document_{kind.value}")).filter(model.Person.id == person_id).scalar()
+
+
 def get_beneficiary(db: Session, beneficiary_id: UUID):
     return db.query(model.Beneficiary).filter(model.Beneficiary.id == beneficiary_id, model.Beneficiary.deleted_at == None).first()
 
 
 def delete_person(db: Session, person: model.Person):
     person.deleted_at = datetime.now()
+
+    if person.company_id is not None:
+        db.execute(company_counters_update(person.company_id, persons_active=-1,
+                                           persons_verified=-1 if person.verified_at is not None else 0))
+
     db.commit()
 
     return
@@ -95,14 +219,12 @@ def delete_person(db: Session, person: model.Person):
 
 def delete_beneficiary(db: Session, beneficiary: model.Beneficiary):
     beneficiary.deleted_at = datetime.now()
-    db.commit()
 
-    beneficiaries = db.query(model.Company).join(model.Company.beneficiaries, aliased=True)\
-        .filter(model.Company.id == beneficiary.company.id, model.Beneficiary.deleted_at == None)
+    if beneficiary.company_id is not None:
+        db.execute(company_counters_update(beneficiary.company_id, beneficiaries_active=-1))
+        company_status.apply(db, company_status.beneficiaries_removed(beneficiary.company_id))
 
-    if beneficiaries.count() == 0:
-        beneficiary.company.status = 1
-        db.commit()
+    db.commit()
 
     return
 
@@ -126,8 +248,34 @@ def get_person_by_id_number(db: Session, id_number: str):
     return db.query(model.Person).filter(model.Person.id_number == id_number, model.Person.deleted_at == None).first()
 
 
-def get_persons(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(model.Person).filter(model.Person.deleted_at == None).offset(skip).limit(limit).all()
+def get_persons(db: Session, skip: int = 0, limit: int = 100, after=None, fields=None):
+    return paginate(db.query(*project(PERSON_COLUMNS, fields)).filter(model.Person.deleted_at == None),
+                    model.Person, skip=skip, limit=limit, after=after)
+
+
+def export_companies(db: Session, batch_size: int):
+    return db.query(
+        model.Company.id, model.Company.name, model.Company.id_number, model.Company.dic, model.Company.registry,
+        model.Company.status, model.Company.created_at, model.Company.finstat_at,
+        model.Person.id.label("person_id"), model.Person.name.label("person_name"),
+        model.Person.surname.label("person_surname"), model.Person.email.label("person_email"),
+        model.Person.requested_at.label("person_requested_at"),
+        model.Person.verified_at.label("person_verified_at"),
+    ).outerjoin(
+        model.Person, (model.Person.company_id == model.Company.id) & (model.Person.deleted_at == None)
+    ).order_by(model.Company.created_at, model.Company.id, model.Person.created_at).yield_per(batch_size)
+
+
+def export_persons(db: Session, batch_size: int):
+    return db.query(
+        model.Person.id, model.Person.name, model.Person.surname, model.Person.email, model.Person.country,
+        model.Person.id_number, model.Person.document_type, model.Person.document_number,
+        model.Person.created_at, model.Person.requested_at, model.Person.verified_at, model.Person.company_id,
+        model.Company.name.label("company_name"), model.Company.id_number.label("company_id_number"),
+    ).outerjoin(
+        model.Company, model.Company.id == model.Person.company_id
+    ).filter(model.Person.deleted_at == None).order_by(model.Person.created_at, model.Person.id) \
+        .yield_per(batch_size)
 
 
 def create_person(db: Session, person: schema.PersonCreate):
@@ -138,20 +286,17 @@ def create_person(db: Session, person: schema.PersonCreate):
         country=person.country,
         id_number=person.id_number,
         document_type=person.document_type,
-        document_number=person.document_number,
-        document_front=person.document_front,
-        document_back=person.document_back,
-        document_verification_photo=person.document_verification_photo
+        document_number=person.document_number
     )
+    store_person_documents(db_person, person)
 
     if person.company is not None:
         db_company = get_company(db, person.company)
 
         if db_company is not None:
             db_person.company = db_company
-
-            if db_company.status == 5:
-                db_company.status = 4
+            db.execute(company_counters_update(db_company.id, persons_active=1))
+            company_status.apply(db, company_status.person_added(db_company.id))
 
     if person.address is not None:
         address = create_address(db, person.address)
@@ -164,6 +309,21 @@ def create_person(db: Session, person: schema.PersonCreate):
     return db_person
 
 
+def store_person_documents(db_person: model.Person, person):
+    for kind in DocumentKind:
+        value = getattr(person, f"document_{kind.value}")
+        if value is not None:
+            setattr(db_person, f"document_{kind.value}_ref", blob_store.put_base64(value))
+
+
+def set_person_document(db: Session, db_person: model.Person, kind: DocumentKind, ref: str):
+    setattr(db_person, f"document_{kind.value}_ref", ref)
+    setattr(db_person, f"document_{kind.value}", None)
+    db.commit()
+
+    return db_person
+
+
 def update_person(person_id: UUID, db: Session, person: schema.PersonUpdate):
     db_person = get_person(db, person_id)
 
@@ -193,22 +353,14 @@ def verify_person(db: Session, db_person: schema.Person, person: schema.PersonVe
     db_person.id_number = person.id_number
     db_person.document_type = person.document_type
     db_person.document_number = person.document_number
-    db_person.document_front = person.document_front
-    db_person.document_back = person.document_back
-    db_person.document_verification_photo = person.document_verification_photo
+    store_person_documents(db_person, person)
     db_person.address = [address]
-    db_person.verified_at = datetime.now()
-
-    db.commit()
-    all_verified = True
-    company = get_company(db, db_person.company_id)
 
-    for p in company.persons:
-        if p.verified_at is None and p.deleted_at is None:
-            all_verified = False
+    verified = db.execute(person_verified_update(db_person.id)).first() is not None
 
-    if all_verified and company.status == 4:
-        company.status = 5
+    if verified and db_person.company_id is not None:
+        db.execute(company_counters_update(db_person.company_id, persons_verified=1))
+        company_status.apply(db, company_status.kyc_verified(db_person.company_id))
 
     db.commit()
     db.refresh(db_person)
@@ -216,8 +368,9 @@ def verify_person(db: Session, db_person: schema.Person, person: schema.PersonVe
     return db_person
 
 
-def get_beneficiaries(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(model.Beneficiary).filter(model.Beneficiary.deleted_at == None).offset(skip).limit(limit).all()
+def get_beneficiaries(db: Session, skip: int = 0, limit: int = 100, after=None):
+    return paginate(db.query(*BENEFICIARY_COLUMNS).filter(model.Beneficiary.deleted_at == None),
+                    model.Beneficiary, skip=skip, limit=limit, after=after)
 
 
 def create_beneficiary(db: Session, beneficiary: schema.BeneficiaryBase):
@@ -232,7 +385,8 @@ def create_beneficiary(db: Session, beneficiary: schema.BeneficiaryBase):
         if db_company is not None:
             db_beneficiary.company_id = db_company.id
             db_beneficiary.company = db_company
-            db_company.status = 2
+            db.execute(company_counters_update(db_company.id, beneficiaries_active=1))
+            company_status.apply(db, company_status.beneficiary_added(db_company.id))
 
     db.add(db_beneficiary)
     db.commit()
@@ -258,10 +412,6 @@ def get_user_by_id(db: Session, user_id: UUID) -> model.User:
     return db.query(model.User).filter(model.User.id == user_id).first()
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-
 def get_password_hash(password):
     return pwd_context.hash(password)
 
@@ -276,16 +426,19 @@ def create_user(db: Session, user: UserCreate):
     )
 
     db.add(db_user)
+    notify_user_changed(db, db_user.email)
     db.commit()
+    user_cache.invalidate(db_user.email)
     db.refresh(db_user)
 
     return db_user
 
 
-def write_finstat_company_data(company: model.Company, finstat: schema.FinstatCompany):
+def write_finstat_company_data(company: model.Company, finstat: schema.FinstatCompany, fetched_at: datetime = None):
     company.name = finstat.Name
     company.id_number = finstat.Ico
     company.dic = finstat.Dic
+    company.finstat_at = fetched_at or datetime.now()
     address = model.Address(
         city=finstat.City,
         street=finstat.Street,
@@ -297,33 +450,65 @@ def write_finstat_company_data(company: model.Company, finstat: schema.FinstatCo
     return company
 
 
-def search_companies(db: Session, query: str):
-    return db.query(model.Company).filter(model.Company.id_number.ilike(f'%{query}%')
-                                          | model.Company.name.ilike(f'%{query}%')
-                                          | model.Company.dic.ilike(f'%{query}%')
-                                          ).all()
+def _like_pattern(query: str):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def search_companies(db: Session, query: str, skip: int = 0, limit: int = 50, fields=None):
+    text_query = normalize_text(query)
+    digits_query = normalize_numeric_query(query)
+
+    if not text_query:
+        return []
+
+    text_pattern = _like_pattern(text_query)
+
+    company_filter = model.Company.search_name.like(text_pattern)
+    company_scores = [func.similarity(model.Company.search_name, text_query)]
+    person_filter = model.Person.search_name.like(text_pattern) | model.Person.search_email.like(text_pattern)
+    person_scores = [func.similarity(model.Person.search_name, text_query),
+                     func.similarity(model.Person.search_email, text_query)]
+
+    if digits_query:
+        digits_pattern = _like_pattern(digits_query)
+        company_filter = company_filter \
+                         | model.Company.search_id_number.like(digits_pattern) \
+                         | model.Company.search_dic.like(digits_pattern)
+        company_scores += [func.similarity(model.Company.search_id_number, digits_query),
+                           func.similarity(model.Company.search_dic, digits_query)]
+        person_filter = person_filter | model.Person.search_id_number.like(digits_pattern)
+        person_scores.append(func.similarity(model.Person.search_id_number, digits_query))
 
+    company_matches = select(
+        model.Company.id.label('company_id'),
+        func.greatest(*company_scores).label('score')
+    ).where(company_filter)
 
-def search_companies_by_persons(db: Session, query: str):
-    return db.query(model.Company).join(model.Company.persons) \
-        .filter(model.Company.persons.property.mapper.class_.deleted_at == None,
-                model.Company.persons.property.mapper.class_.id_number.ilike(f'%{query}%')
-                | model.Company.persons.property.mapper.class_.email.ilike(f'%{query}%')
-                | model.Company.persons.property.mapper.class_.name.ilike(f'%{query}%')
-                | model.Company.persons.property.mapper.class_.surname.ilike(f'%{query}%')
-                ).all()
+    person_matches = select(
+        model.Person.company_id.label('company_id'),
+        func.greatest(*person_scores).label('score')
+    ).where(model.Person.deleted_at == None, model.Person.company_id != None, person_filter)
 
+    beneficiary_matches = select(
+        model.Beneficiary.company_id.label('company_id'),
+        func.similarity(model.Beneficiary.search_name, text_query).label('score')
+    ).where(model.Beneficiary.deleted_at == None,
+            model.Beneficiary.company_id != None,
+            model.Beneficiary.search_name.like(text_pattern))
 
-def search_companies_by_beneficiaries(db: Session, query: str):
-    return db.query(model.Company).join(model.Company.beneficiaries) \
-        .filter(model.Company.beneficiaries.property.mapper.class_.deleted_at == None,
-                model.Company.beneficiaries.property.mapper.class_.name.ilike(f'%{query}%')
-                | model.Company.beneficiaries.property.mapper.class_.surname.ilike(f'%{query}%')
-                ).all()
+    matches = union_all(company_matches, person_matches, beneficiary_matches).subquery()
+    ranked = select(matches.c.company_id, func.max(matches.c.score).label('score')) \
+        .group_by(matches.c.company_id).subquery()
 
+    return db.query(*project(COMPANY_COLUMNS, fields)) \
+        .join(ranked, model.Company.id == ranked.c.company_id) \
+        .order_by(ranked.c.score.desc(), model.Company.name, model.Company.id) \
+        .offset(skip).limit(limit).all()
 
-def get_users(db):
-    return db.query(model.User).all()
+
+def get_users(db, skip: int = 0, limit: int = 100, after=None):
+    return paginate(db.query(model.User), model.User, skip=skip, limit=limit, after=after)
 
 
 def update_user_validity(db: Session, user_id, new_state):
@@ -336,7 +521,13 @@ def update_user_validity(db: Session, user_id, new_state):
         return
 
     db_user.active = new_state
+    version = bump_token_version(db, db_user) if not new_state else None
+    notify_user_changed(db, db_user.email)
     db.commit()
+    user_cache.invalidate(db_user.email)
+
+    if version is not None:
+        token_versions.set(str(db_user.id), version)
 
     return
 
@@ -344,7 +535,7 @@ def update_user_validity(db: Session, user_id, new_state):
 def add_system_user():
     print("CHECK FOR SYS ADMIN")
     db = next(get_db())
-    users = get_users(db)
+    users = get_users(db, limit=1)
     if len(users) == 0:
         print("CREATING SYS ADMIN")
         user = UserCreate(**{"email": os.environ["ADMIN_MAIL"], "name": "SYSTEM", "surname": "ADMIN",
@@ -355,32 +546,54 @@ def add_system_user():
     return
 
 
+def scrape_persons_for_companies(company_ids: List[UUID]):
+    db = SessionLocal()
+    try:
+        for company_id in company_ids:
+            company = get_company(db, company_id)
+            if company is None:
+                continue
+            try:
+                scrape_persons_for_company(db, company)
+            except Exception as e:
+                db.rollback()
+                print(f"SCRAPING PERSONS FOR {company.id_number} FAILED: {e}")
+    finally:
+        db.close()
+
+
 def scrape_persons_for_company(db: Session, company: model.Company):
     person_list = get_names(company.id_number)
+    names = []
     for p in person_list:
         p = p.split(" ")
-        create_person(db, schema.PersonCreate(**{"name": " ".join(p[:-1]), "surname": p[-1], "company": company.id}))
+        names.append((" ".join(p[:-1]), p[-1]))
 
+    create_persons_for_company(db, company, names)
 
-def create_reset_token(db: Session, user: User):
-    token = model.ResetToken(
-        user=user,
-    )
-
-    db.add(token)
-    db.commit()
-    db.refresh(token)
-
-    return token
 
+def create_persons_for_company(db: Session, company: model.Company, names: List[Tuple[str, str]]):
+    existing = set(db.query(model.Person.name, model.Person.surname)
+                   .filter(model.Person.company_id == company.id, model.Person.deleted_at == None).all())
+    rows = []
 
-def get_reset_token(db: Session, token: UUID):
-    return db.query(model.ResetToken).filter(model.ResetToken.token == token, model.ResetToken.used_at == None).first()
+    for name, surname in names:
+        if (name, surname) in existing:
+            continue
+        existing.add((name, surname))
+        rows.append({
+            "id": uuid.uuid4(),
+            "name": name,
+            "surname": surname,
+            "company_id": company.id,
+            "search_name": normalize_full_name(name, surname),
+        })
 
+    if rows:
+        db.execute(insert(model.Person).values(rows))
+        db.execute(company_counters_update(company.id, persons_active=len(rows)))
+        company_status.apply(db, company_status.person_added(company.id))
 
-def update_user_password(db: Session, user: User, new_password: str):
-    user.password = get_password_hash(new_password)
     db.commit()
-    db.refresh(user)
 
-    return user
+    return len(rows)
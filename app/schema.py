@@ -2,7 +2,10 @@ from datetime import datetime
 from typing import List, Optional, Dict, Any
 from uuid import UUID
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, validator
+
+from app import blob_store
+from app.enums import DocumentKind
 
 
 class AddressBase(BaseModel):
@@ -23,6 +26,20 @@ class Address(AddressBase):
         orm_mode = True
 
 
+class CompanySuggestion(BaseModel):
+    id: UUID
+    name: Optional[str]
+    id_number: Optional[str]
+
+
+class CompanyImportResult(BaseModel):
+    row: int
+    id_number: Optional[str]
+    status: str
+    id: Optional[UUID]
+    detail: Optional[str]
+
+
 class CompanyCheck(BaseModel):
     name: Optional[str]
     id_number: Optional[str]
@@ -60,6 +77,27 @@ class Person(PersonBase):
         orm_mode = True
 
 
+class PersonSummary(BaseModel):
+    id: UUID
+    email: Optional[str]
+    name: Optional[str]
+    surname: Optional[str]
+    country: Optional[str]
+    id_number: Optional[str]
+    document_type: Optional[str]
+    document_number: Optional[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+    requested_at: Optional[datetime]
+    verified_at: Optional[datetime]
+    deleted_at: Optional[datetime]
+    company_id: Optional[UUID]
+    addresses: Optional[List[Address]]
+
+    class Config:
+        orm_mode = True
+
+
 class CompanyBase(BaseModel):
     id_number: str
     dic: Optional[str]
@@ -69,6 +107,13 @@ class CompanyBase(BaseModel):
     address: Optional[AddressCreate]
 
 
+def document_base64(value: Optional[str]):
+    if value is not None and not blob_store.is_base64(value):
+        raise ValueError("document is not valid base64")
+
+    return value
+
+
 class PersonCreate(PersonBase):
     address: Optional[AddressCreate]
     document_front: Optional[str]
@@ -76,6 +121,9 @@ class PersonCreate(PersonBase):
     document_verification_photo: Optional[str]
     company: Optional[UUID]
 
+    _documents = validator("document_front", "document_back", "document_verification_photo",
+                           allow_reuse=True)(document_base64)
+
 
 class PersonVerify(BaseModel):
     id: UUID
@@ -90,6 +138,15 @@ class PersonVerify(BaseModel):
     document_back: Optional[str]
     document_verification_photo: Optional[str]
 
+    _documents = validator("document_front", "document_back", "document_verification_photo",
+                           allow_reuse=True)(document_base64)
+
+
+class PersonDocument(BaseModel):
+    kind: DocumentKind
+    ref: str
+    size: int
+
 
 class PersonUpdate(BaseModel):
     email: Optional[str]
@@ -116,6 +173,9 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     email: Optional[str] = None
+    user_id: Optional[UUID] = None
+    active: Optional[bool] = None
+    version: Optional[int] = None
 
 
 class FinstatCompany(BaseModel):
@@ -138,6 +198,10 @@ class FinstatCompany(BaseModel):
     RevenueActual: Optional[str]
 
 
+class FinstatIcoList(BaseModel):
+    icos: List[str]
+
+
 class EmailSchema(BaseModel):
     email: List[EmailStr]
     body: Dict[str, Any]
@@ -168,9 +232,31 @@ class Beneficiary(BeneficiaryBase):
 
 class Company(CompanyBase):
     id: UUID
+    persons_active: Optional[int]
+    persons_verified: Optional[int]
+    beneficiaries_active: Optional[int]
     addresses: List[Address] = []
     persons: List[Person] = []
     beneficiaries: List[Beneficiary] = []
 
     class Config:
         orm_mode = True
+
+
+class CompanySummary(BaseModel):
+    id: UUID
+    id_number: Optional[str]
+    dic: Optional[str]
+    name: Optional[str]
+    registry: Optional[str]
+    status: Optional[str]
+    address: Optional[AddressCreate]
+    persons_active: Optional[int]
+    persons_verified: Optional[int]
+    beneficiaries_active: Optional[int]
+    addresses: Optional[List[Address]]
+    persons: Optional[List[Person]]
+    beneficiaries: Optional[List[Beneficiary]]
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,105 @@
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app import repository
+
+COMPANY_FIELDS = ("id_number", "dic", "name", "registry", "status", "address", "id", "persons_active",
+                  "persons_verified", "beneficiaries_active")
+PERSON_FIELDS = ("email", "name", "surname", "country", "id_number", "document_type", "document_number",
+                 "created_at", "updated_at", "requested_at", "verified_at", "deleted_at", "id", "company_id")
+PERSON_RELATIONS = ("addresses",)
+
+
+def _parse_list(value: str, allowed, name: str):
+    requested = {item.strip() for item in value.split(",") if item.strip()}
+    unknown = requested.difference(allowed)
+
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown {name}: {', '.join(sorted(unknown))}.")
+
+    return tuple(item for item in allowed if item in requested)
+
+
+def parse_view(fields, include, allowed_fields, allowed_relations):
+    if fields is not None:
+        fields = _parse_list(fields, allowed_fields, "fields")
+        fields = tuple(field for field in allowed_fields if field in fields or field == "id")
+    if include is not None:
+        include = _parse_list(include, allowed_relations, "include")
+    elif fields is not None:
+        include = ()
+
+    return fields, include
+
+
+def address_dict(row):
+    return {
+        "city": row.city,
+        "street": row.street,
+        "number": row.number,
+        "zip": row.zip,
+        "id": row.id,
+    }
+
+
+def person_dict(row, fields=PERSON_FIELDS, addresses=()):
+    record = {field: getattr(row, field) for field in fields}
+
+    if addresses is not None:
+        record["addresses"] = [address_dict(address) for address in addresses]
+
+    return record
+
+
+def beneficiary_dict(row):
+    return {
+        "name": row.name,
+        "surname": row.surname,
+        "company_id": row.company_id,
+        "id": row.id,
+        "created_at": row.created_at,
+        "updated_at": row.updated_at,
+        "deleted_at": row.deleted_at,
+    }
+
+
+def _company_value(row, field: str):
+    if field == "address":
+        return None
+    if field == "status":
+        return None if row.status is None else str(row.status)
+
+    return getattr(row, field)
+
+
+def company_dict(row, fields=COMPANY_FIELDS, addresses=None, persons=None, beneficiaries=None):
+    record = {field: _company_value(row, field) for field in fields}
+
+    if addresses is not None:
+        record["addresses"] = [address_dict(address) for address in addresses]
+    if persons is not None:
+        record["persons"] = [person_dict(person) for person in persons]
+    if beneficiaries is not None:
+        record["beneficiaries"] = [beneficiary_dict(beneficiary) for beneficiary in beneficiaries]
+
+    return record
+
+
+def company_dicts(db: Session, rows, fields=None, include=None):
+    fields = COMPANY_FIELDS if fields is None else fields
+    include = repository.COMPANY_RELATIONS if include is None else include
+    relations = repository.get_company_relations(db, [row.id for row in rows], include)
+
+    return [company_dict(row, fields, **{relation: relations[relation].get(row.id, ()) for relation in include})
+            for row in rows]
+
+
+def person_dicts(db: Session, rows, fields=None, include=None):
+    fields = PERSON_FIELDS if fields is None else fields
+
+    if include is None:
+        return [person_dict(row, fields) for row in rows]
+
+    addresses = repository.get_person_addresses(db, [row.id for row in rows]) if "addresses" in include else None
+
+    return [person_dict(row, fields, None if addresses is None else addresses.get(row.id, ())) for row in rows]
@@ -0,0 +1,91 @@
+import threading
+from bisect import bisect_left, insort
+
+from sqlalchemy.orm import Session
+
+from app import model
+from app.normalization import normalize_text, normalize_digits, normalize_numeric_query
+
+
+class CompanySuggestIndex:
+    def __init__(self):
+        self._keys = []
+        self._companies = {}
+        self._lock = threading.Lock()
+
+    def build(self, db: Session):
+        rows = db.query(model.Company.id, model.Company.name, model.Company.id_number, model.Company.dic).all()
+        keys = []
+        companies = {}
+
+        for row in rows:
+            companies[row.id] = (row.name, row.id_number)
+            keys.extend(_index_keys(row.id, row.name, row.id_number, row.dic))
+
+        keys.sort()
+
+        with self._lock:
+            self._keys = keys
+            self._companies = companies
+
+    def add(self, company: model.Company):
+        if company.id is None:
+            return
+
+        self.add_entry(company.id, company.name, company.id_number, company.dic)
+
+    def add_entry(self, company_id, name, id_number, dic):
+        with self._lock:
+            self._remove(company_id)
+            self._companies[company_id] = (name, id_number)
+            for key in _index_keys(company_id, name, id_number, dic):
+                insort(self._keys, key)
+
+    def suggest(self, query: str, limit: int = 10):
+        prefixes = []
+        for prefix in (normalize_text(query), normalize_numeric_query(query)):
+            if prefix and prefix not in prefixes:
+                prefixes.append(prefix)
+        results = []
+        seen = set()
+
+        with self._lock:
+            for prefix in prefixes:
+                position = bisect_left(self._keys, (prefix,))
+                while position < len(self._keys) and len(results) < limit:
+                    key, company_id = self._keys[position]
+                    if not key.startswith(prefix):
+                        break
+                    if company_id not in seen:
+                        seen.add(company_id)
+                        name, id_number = self._companies[company_id]
+                        results.append({"id": company_id, "name": name, "id_number": id_number})
+                    position += 1
+
+        return results
+
+    def _remove(self, company_id):
+        if company_id not in self._companies:
+            return
+
+        self._keys = [key for key in self._keys if key[1] != company_id]
+        del self._companies[company_id]
+
+
+def _index_keys(company_id, name, id_number, dic):
+    keys = set()
+    normalized_name = normalize_text(name)
+
+    if normalized_name:
+        words = normalized_name.split(' ')
+        for i in range(len(words)):
+            keys.add(' '.join(words[i:]))
+
+    for number in (normalize_digits(id_number), normalize_digits(dic)):
+        if number:
+            keys.add(number)
+
+    return [(key, company_id) for key in keys]
+
+
+company_index = CompanySuggestIndex()
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import asyncpg
+from sqlalchemy import func, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import model
+from app.database import get_db_link
+
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", 30))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 1024))
+USER_CACHE_CHANNEL = "user_cache"
+TOKEN_VERSION_CHANNEL = "token_version"
+TOKEN_VERSION_REFRESH_SECONDS = float(os.environ.get("TOKEN_VERSION_REFRESH_SECONDS", 10))
+LISTEN_RETRY_SECONDS = 5
+
+
+class UserCache:
+    def __init__(self, ttl: float, size: int):
+        self.ttl = ttl
+        self.size = size
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, email: str):
+        with self._lock:
+            entry = self._users.get(email)
+            if entry is None:
+                return None
+
+            user, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._users[email]
+                return None
+
+            self._users.move_to_end(email)
+            return user
+
+    def put(self, email: str, user: model.User):
+        snapshot = model.User(**{column.key: getattr(user, column.key) for column in model.User.__table__.columns})
+
+        with self._lock:
+            self._users[email] = (snapshot, time.monotonic() + self.ttl)
+            self._users.move_to_end(email)
+            while len(self._users) > self.size:
+                self._users.popitem(last=False)
+
+    def invalidate(self, email: str):
+        with self._lock:
+            self._users.pop(email, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+class TokenVersions:
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str):
+        return self._versions.get(user_id)
+
+    def set(self, user_id: str, version: int):
+        with self._lock:
+            self._versions[user_id] = max(version, self._versions.get(user_id, version))
+
+    def merge(self, versions):
+        with self._lock:
+            for user_id, version in versions.items():
+                self._versions[user_id] = max(version, self._versions.get(user_id, version))
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+
+
+user_cache = UserCache(USER_CACHE_TTL_SECONDS, USER_CACHE_SIZE)
+token_versions = TokenVersions()
+
+
+def user_changed_notification(email: str):
+    return select(func.pg_notify(USER_CACHE_CHANNEL, email))
+
+
+def notify_user_changed(db, email: str):
+    db.execute(user_changed_notification(email))
+
+
+def _token_version_bump(user: model.User):
+    return update(model.User).where(model.User.id == user.id) \
+        .values(token_version=model.User.token_version + 1).returning(model.User.token_version) \
+        .execution_options(synchronize_session=False)
+
+
+def _token_version_notification(user: model.User, version: int):
+    return select(func.pg_notify(TOKEN_VERSION_CHANNEL, f"{user.id}:{version}"))
+
+
+def bump_token_version(db, user: model.User):
+    version = db.execute(_token_version_bump(user)).scalar_one()
+    db.execute(_token_version_notification(user, version))
+    set_committed_value(user, "token_version", version)
+
+    return version
+
+
+async def bump_token_version_async(db, user: model.User):
+    version = (await db.execute(_token_version_bump(user))).scalar_one()
+    await db.execute(_token_version_notification(user, version))
+    set_committed_value(user, "token_version", version)
+
+    return version
+
+
+def _on_notification(connection, pid, channel, email):
+    user_cache.invalidate(email)
+
+
+def _on_token_version(connection, pid, channel, payload):
+    user_id, version = payload.rsplit(":", 1)
+    token_versions.set(user_id, int(version))
+
+
+async def _refresh_token_versions(connection):
+    rows = await connection.fetch('SELECT id, token_version FROM "user"')
+    token_versions.merge({str(row["id"]): row["token_version"] for row in rows})
+
+
+async def listen_for_user_changes():
+    while True:
+        try:
+            connection = await asyncpg.connect(get_db_link())
+            try:
+                await connection.add_listener(USER_CACHE_CHANNEL, _on_notification)
+                await connection.add_listener(TOKEN_VERSION_CHANNEL, _on_token_version)
+                user_cache.clear()
+                while True:
+                    await _refresh_token_versions(connection)
+                    await asyncio.sleep(TOKEN_VERSION_REFRESH_SECONDS)
+            finally:
+                await connection.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            user_cache.clear()
+            token_versions.clear()
+            print(f"User cache listener disconnected: {e}")
+
+        await asyncio.sleep(LISTEN_RETRY_SECONDS)
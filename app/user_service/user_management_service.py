@@ -1,15 +1,17 @@
-from typing import List
+from typing import List, Optional
 from uuid import UUID
-from fastapi import Depends, HTTPException, APIRouter
+from fastapi import Depends, HTTPException, APIRouter, Request, Response
 from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from starlette.responses import PlainTextResponse
 from datetime import datetime
 from pydantic import EmailStr
 import os
-from app import repository, model
+from app import repository, async_repository, model
 from app.auth_utils import get_current_user
-from app.database import get_db
+from app.database import get_db, get_async_db, get_read_db, stick_to_primary
+from app.pagination import decode_cursor, next_page_headers
 from app.user_service.schema_user import User, UserCreate, ResetPassword, UpdatePassword
 from app import schema
 from app import email_sender
@@ -22,23 +24,27 @@ app = APIRouter(
 )
 
 
-@app.post("/", response_model=User)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = repository.get_user_by_email(db, email=user.email)
+@app.post("/", response_model=User, dependencies=[Depends(stick_to_primary)])
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await async_repository.get_user_by_email(db, email=user.email)
 
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    return repository.create_user(db=db, user=user)
+    return await async_repository.create_user(db=db, user=user)
 
 
 @app.get("s", response_model=List[User])
-def read_users(db: Session = Depends(get_db), current_user: model.User = Depends(get_current_user)):
-    return repository.get_users(db)
+def read_users(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+               db: Session = Depends(get_read_db), current_user: model.User = Depends(get_current_user)):
+    users = repository.get_users(db, skip=skip, limit=limit, after=decode_cursor(cursor))
+    response.headers.update(next_page_headers(request, users, limit))
+
+    return users
 
 
 @app.get("/{user_id}", response_model=User)
-def read_users(user_id: UUID, db: Session = Depends(get_db), current_user: model.User = Depends(get_current_user)):
+def read_users(user_id: UUID, db: Session = Depends(get_read_db), current_user: model.User = Depends(get_current_user)):
     db_user = repository.get_user_by_id(db, user_id=user_id)
 
     if db_user is None:
@@ -47,7 +53,7 @@ def read_users(user_id: UUID, db: Session = Depends(get_db), current_user: model
     return db_user
 
 
-@app.post("/update-validity", response_class=PlainTextResponse)
+@app.post("/update-validity", response_class=PlainTextResponse, dependencies=[Depends(stick_to_primary)])
 def update_user_valid(user_id: UUID, new_valid_state: bool, db: Session = Depends(get_db),
                   current_user: model.User = Depends(get_current_user)):
     try:
@@ -58,14 +64,14 @@ def update_user_valid(user_id: UUID, new_valid_state: bool, db: Session = Depend
     return "OK"
 
 
-@app.post("/reset-password", response_class=PlainTextResponse)
-async def reset_password(reset_password: ResetPassword, db: Session = Depends(get_db)):
-    db_user = repository.get_user_by_email(db, email=reset_password.email)
+@app.post("/reset-password", response_class=PlainTextResponse, dependencies=[Depends(stick_to_primary)])
+async def reset_password(reset_password: ResetPassword, db: AsyncSession = Depends(get_async_db)):
+    db_user = await async_repository.get_user_by_email(db, email=reset_password.email)
 
     if db_user is None:
         raise HTTPException(status_code=400, detail="Error.")
 
-    token = repository.create_reset_token(db=db, user=db_user)
+    token = await async_repository.create_reset_token(db=db, user=db_user)
     email_str = [EmailStr(reset_password.email)]
     body = {"link": os.environ["FRONTEND_RESET_PASSWORD_URL"] + '?token=' + str(token.token)}
     email = schema.EmailSchema(email=email_str, body=body)
@@ -74,14 +80,14 @@ async def reset_password(reset_password: ResetPassword, db: Session = Depends(ge
     return "OK"
 
 
-@app.post("/update-password", response_model=User)
-def update_password(update_password: UpdatePassword, db: Session = Depends(get_db)):
-    reset_token = repository.get_reset_token(db=db, token=update_password.token)
+@app.post("/update-password", response_model=User, dependencies=[Depends(stick_to_primary)])
+async def update_password(update_password: UpdatePassword, db: AsyncSession = Depends(get_async_db)):
+    reset_token = await async_repository.get_reset_token(db=db, token=update_password.token)
 
     if reset_token is None:
         raise HTTPException(status_code=404, detail="Token invalid.")
 
     reset_token.used_at = datetime.now()
-    db.commit()
 
-    return repository.update_user_password(db=db, user=reset_token.user, new_password=update_password.password)
+    return await async_repository.update_user_password(db=db, user=reset_token.user,
+                                                       new_password=update_password.password)
@@ -0,0 +1,29 @@
+"""finstat-cache
+
+Revision ID: 1902557a820a
+Revises: ab3054655842
+Create Date: 2022-05-27 09:41:17.503821
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '1902557a820a'
+down_revision = 'ab3054655842'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('finstat_cache',
+    sa.Column('ico', sa.String(), nullable=False),
+    sa.Column('data', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('fetched_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('ico')
+    )
+
+
+def downgrade():
+    op.drop_table('finstat_cache')
@@ -0,0 +1,78 @@
+"""lookup-indexes
+
+Revision ID: 4ec161a073e2
+Revises: 6d164e59fc36
+Create Date: 2022-05-18 13:05:19.882470
+
+"""
+import sys
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4ec161a073e2'
+down_revision = '6d164e59fc36'
+branch_labels = None
+depends_on = None
+
+
+UNIQUE_COLUMNS = (('user', 'email'), ('company', 'id_number'))
+
+
+def _check_duplicates(connection):
+    for table, column in UNIQUE_COLUMNS:
+        duplicates = connection.execute(sa.text(
+            f'SELECT {column} FROM "{table}" WHERE {column} IS NOT NULL GROUP BY {column} HAVING count(*) > 1 '
+            f'ORDER BY {column} LIMIT 10'
+        )).scalars().all()
+        if duplicates:
+            sys.exit(f'Can not create the unique index on {table}.{column}, these values are duplicated: '
+                     f'{", ".join(duplicates)}. Merge or fix the rows and run the migration again.')
+
+
+def _create_index(connection, name, table, columns, **kw):
+    # A failed CONCURRENTLY build leaves an INVALID index behind, drop it so the build can be retried
+    valid = connection.execute(sa.text(
+        'SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name'
+    ), {'name': name}).scalar()
+    if valid:
+        return
+    if valid is not None:
+        op.drop_index(name, table_name=table, postgresql_concurrently=True)
+
+    op.create_index(name, table, columns, postgresql_concurrently=True, **kw)
+
+
+def upgrade():
+    connection = op.get_bind()
+    _check_duplicates(connection)
+
+    # CONCURRENTLY can not run inside a transaction, so every statement commits on its own
+    with op.get_context().autocommit_block():
+        _create_index(connection, op.f('ix_address_company_id'), 'address', ['company_id'], unique=False)
+        _create_index(connection, op.f('ix_address_person_id'), 'address', ['person_id'], unique=False)
+        _create_index(connection, op.f('ix_person_company_id'), 'person', ['company_id'], unique=False)
+        _create_index(connection, op.f('ix_beneficiary_company_id'), 'beneficiary', ['company_id'], unique=False)
+        _create_index(connection, op.f('ix_reset_token_user_id'), 'reset_token', ['user_id'], unique=False)
+        _create_index(connection, op.f('ix_user_email'), 'user', ['email'], unique=True)
+        _create_index(connection, op.f('ix_company_id_number'), 'company', ['id_number'], unique=True)
+        _create_index(connection, 'ix_person_id_number_active', 'person', ['id_number'], unique=False,
+                      postgresql_where=sa.text('deleted_at IS NULL'))
+        _create_index(connection, 'ix_beneficiary_company_id_name_surname_active', 'beneficiary',
+                      ['company_id', 'name', 'surname'], unique=False, postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_beneficiary_company_id_name_surname_active', table_name='beneficiary',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_person_id_number_active', table_name='person', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_company_id_number'), table_name='company', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_user_email'), table_name='user', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_reset_token_user_id'), table_name='reset_token', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_beneficiary_company_id'), table_name='beneficiary', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_person_company_id'), table_name='person', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_address_person_id'), table_name='address', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_address_company_id'), table_name='address', postgresql_concurrently=True)
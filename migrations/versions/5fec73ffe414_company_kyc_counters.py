@@ -0,0 +1,49 @@
+"""company-kyc-counters
+
+Revision ID: 5fec73ffe414
+Revises: f6ac83bed57f
+Create Date: 2022-05-23 09:31:18.604217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5fec73ffe414'
+down_revision = 'f6ac83bed57f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('company', sa.Column('persons_active', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('company', sa.Column('persons_verified', sa.Integer(), server_default=sa.text('0'),
+                                       nullable=False))
+    op.add_column('company', sa.Column('beneficiaries_active', sa.Integer(), server_default=sa.text('0'),
+                                       nullable=False))
+
+    op.execute("""
+        UPDATE company SET persons_active = counts.active, persons_verified = counts.verified
+        FROM (
+            SELECT company_id, count(*) AS active, count(verified_at) AS verified
+            FROM person WHERE deleted_at IS NULL AND company_id IS NOT NULL
+            GROUP BY company_id
+        ) AS counts
+        WHERE company.id = counts.company_id
+    """)
+    op.execute("""
+        UPDATE company SET beneficiaries_active = counts.active
+        FROM (
+            SELECT company_id, count(*) AS active
+            FROM beneficiary WHERE deleted_at IS NULL AND company_id IS NOT NULL
+            GROUP BY company_id
+        ) AS counts
+        WHERE company.id = counts.company_id
+    """)
+
+
+def downgrade():
+    op.drop_column('company', 'beneficiaries_active')
+    op.drop_column('company', 'persons_verified')
+    op.drop_column('company', 'persons_active')
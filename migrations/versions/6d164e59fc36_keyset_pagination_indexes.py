@@ -0,0 +1,32 @@
+"""keyset-pagination-indexes
+
+Revision ID: 6d164e59fc36
+Revises: efa4adaafb61
+Create Date: 2022-05-16 09:27:55.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d164e59fc36'
+down_revision = 'efa4adaafb61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_company_created_at_id', 'company', ['created_at', 'id'], unique=False)
+    op.create_index('ix_person_created_at_id', 'person', ['created_at', 'id'], unique=False,
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+    op.create_index('ix_beneficiary_created_at_id', 'beneficiary', ['created_at', 'id'], unique=False,
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+    op.create_index('ix_user_created_at_id', 'user', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_created_at_id', table_name='user')
+    op.drop_index('ix_beneficiary_created_at_id', table_name='beneficiary')
+    op.drop_index('ix_person_created_at_id', table_name='person')
+    op.drop_index('ix_company_created_at_id', table_name='company')
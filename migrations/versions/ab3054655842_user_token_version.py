@@ -0,0 +1,24 @@
+"""user-token-version
+
+Revision ID: ab3054655842
+Revises: 5fec73ffe414
+Create Date: 2022-05-26 14:08:52.190375
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ab3054655842'
+down_revision = '5fec73ffe414'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('token_version', sa.Integer(), server_default=sa.text('0'), nullable=False))
+
+
+def downgrade():
+    op.drop_column('user', 'token_version')
@@ -0,0 +1,43 @@
+"""search-trigram-indexes
+
+Revision ID: cac858ee5c29
+Revises: d2659bf854a8
+Create Date: 2022-05-09 10:12:41.513202
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cac858ee5c29'
+down_revision = 'd2659bf854a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_company_name_trgm', 'company', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_company_id_number_trgm', 'company', ['id_number'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'id_number': 'gin_trgm_ops'})
+    op.create_index('ix_company_dic_trgm', 'company', ['dic'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'dic': 'gin_trgm_ops'})
+    op.create_index('ix_person_search_trgm', 'person', ['name', 'surname', 'email', 'id_number'], unique=False,
+                    postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops', 'surname': 'gin_trgm_ops',
+                                    'email': 'gin_trgm_ops', 'id_number': 'gin_trgm_ops'},
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+    op.create_index('ix_beneficiary_search_trgm', 'beneficiary', ['name', 'surname'], unique=False,
+                    postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops', 'surname': 'gin_trgm_ops'},
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_beneficiary_search_trgm', table_name='beneficiary')
+    op.drop_index('ix_person_search_trgm', table_name='person')
+    op.drop_index('ix_company_dic_trgm', table_name='company')
+    op.drop_index('ix_company_id_number_trgm', table_name='company')
+    op.drop_index('ix_company_name_trgm', table_name='company')
@@ -0,0 +1,131 @@
+"""normalized-search-columns
+
+Revision ID: efa4adaafb61
+Revises: cac858ee5c29
+Create Date: 2022-05-11 16:40:03.275918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.normalization import normalize_text, normalize_digits, normalize_full_name
+
+
+# revision identifiers, used by Alembic.
+revision = 'efa4adaafb61'
+down_revision = 'cac858ee5c29'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def _backfill(table, source_columns, normalize):
+    connection = op.get_bind()
+    last_id = None
+
+    while True:
+        query = sa.select(table.c.id, *[table.c[name] for name in source_columns]).order_by(table.c.id) \
+            .limit(BATCH_SIZE)
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+
+        rows = connection.execute(query).fetchall()
+        if not rows:
+            break
+
+        values = [dict(normalize(row), _id=row.id) for row in rows]
+        connection.execute(
+            table.update().where(table.c.id == sa.bindparam('_id')).values(
+                {name: sa.bindparam(name) for name in values[0] if name != '_id'}
+            ),
+            values
+        )
+        last_id = rows[-1].id
+
+
+def upgrade():
+    op.add_column('company', sa.Column('search_name', sa.String(), nullable=True))
+    op.add_column('company', sa.Column('search_id_number', sa.String(), nullable=True))
+    op.add_column('company', sa.Column('search_dic', sa.String(), nullable=True))
+    op.add_column('person', sa.Column('search_name', sa.String(), nullable=True))
+    op.add_column('person', sa.Column('search_email', sa.String(), nullable=True))
+    op.add_column('person', sa.Column('search_id_number', sa.String(), nullable=True))
+    op.add_column('beneficiary', sa.Column('search_name', sa.String(), nullable=True))
+
+    company = sa.table('company', sa.column('id', postgresql.UUID), sa.column('name'), sa.column('id_number'),
+                       sa.column('dic'), sa.column('search_name'), sa.column('search_id_number'),
+                       sa.column('search_dic'))
+    person = sa.table('person', sa.column('id', postgresql.UUID), sa.column('name'), sa.column('surname'),
+                      sa.column('email'), sa.column('id_number'), sa.column('search_name'),
+                      sa.column('search_email'), sa.column('search_id_number'))
+    beneficiary = sa.table('beneficiary', sa.column('id', postgresql.UUID), sa.column('name'),
+                           sa.column('surname'), sa.column('search_name'))
+
+    _backfill(company, ['name', 'id_number', 'dic'], lambda row: {
+        'search_name': normalize_text(row.name),
+        'search_id_number': normalize_digits(row.id_number),
+        'search_dic': normalize_digits(row.dic),
+    })
+    _backfill(person, ['name', 'surname', 'email', 'id_number'], lambda row: {
+        'search_name': normalize_full_name(row.name, row.surname),
+        'search_email': normalize_text(row.email),
+        'search_id_number': normalize_digits(row.id_number),
+    })
+    _backfill(beneficiary, ['name', 'surname'], lambda row: {
+        'search_name': normalize_full_name(row.name, row.surname),
+    })
+
+    op.drop_index('ix_beneficiary_search_trgm', table_name='beneficiary')
+    op.drop_index('ix_person_search_trgm', table_name='person')
+    op.drop_index('ix_company_dic_trgm', table_name='company')
+    op.drop_index('ix_company_id_number_trgm', table_name='company')
+    op.drop_index('ix_company_name_trgm', table_name='company')
+
+    op.create_index('ix_company_search_name_trgm', 'company', ['search_name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'search_name': 'gin_trgm_ops'})
+    op.create_index('ix_company_search_id_number_trgm', 'company', ['search_id_number'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'search_id_number': 'gin_trgm_ops'})
+    op.create_index('ix_company_search_dic_trgm', 'company', ['search_dic'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'search_dic': 'gin_trgm_ops'})
+    op.create_index('ix_person_search_trgm', 'person', ['search_name', 'search_email', 'search_id_number'],
+                    unique=False, postgresql_using='gin',
+                    postgresql_ops={'search_name': 'gin_trgm_ops', 'search_email': 'gin_trgm_ops',
+                                    'search_id_number': 'gin_trgm_ops'},
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+    op.create_index('ix_beneficiary_search_trgm', 'beneficiary', ['search_name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'search_name': 'gin_trgm_ops'},
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade():
+    op.drop_index('ix_beneficiary_search_trgm', table_name='beneficiary')
+    op.drop_index('ix_person_search_trgm', table_name='person')
+    op.drop_index('ix_company_search_dic_trgm', table_name='company')
+    op.drop_index('ix_company_search_id_number_trgm', table_name='company')
+    op.drop_index('ix_company_search_name_trgm', table_name='company')
+
+    op.create_index('ix_company_name_trgm', 'company', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_company_id_number_trgm', 'company', ['id_number'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'id_number': 'gin_trgm_ops'})
+    op.create_index('ix_company_dic_trgm', 'company', ['dic'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'dic': 'gin_trgm_ops'})
+    op.create_index('ix_person_search_trgm', 'person', ['name', 'surname', 'email', 'id_number'], unique=False,
+                    postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops', 'surname': 'gin_trgm_ops',
+                                    'email': 'gin_trgm_ops', 'id_number': 'gin_trgm_ops'},
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+    op.create_index('ix_beneficiary_search_trgm', 'beneficiary', ['name', 'surname'], unique=False,
+                    postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops', 'surname': 'gin_trgm_ops'},
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+
+    op.drop_column('beneficiary', 'search_name')
+    op.drop_column('person', 'search_id_number')
+    op.drop_column('person', 'search_email')
+    op.drop_column('person', 'search_name')
+    op.drop_column('company', 'search_dic')
+    op.drop_column('company', 'search_id_number')
+    op.drop_column('company', 'search_name')
@@ -0,0 +1,103 @@
+"""person-document-blobs
+
+Revision ID: f6ac83bed57f
+Revises: 4ec161a073e2
+Create Date: 2022-05-19 10:12:47.531904
+
+"""
+import base64
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app import blob_store
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6ac83bed57f'
+down_revision = '4ec161a073e2'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 50
+KINDS = ('front', 'back', 'verification_photo')
+
+person = sa.table('person', sa.column('id', postgresql.UUID),
+                  *[sa.column(f'document_{kind}') for kind in KINDS],
+                  *[sa.column(f'document_{kind}_ref') for kind in KINDS])
+
+
+LEGACY_COLUMNS = [f'document_{kind}' for kind in KINDS]
+REF_COLUMNS = [f'document_{kind}_ref' for kind in KINDS]
+
+
+def _migrate(pending, convert):
+    connection = op.get_bind()
+    last_id = None
+
+    while True:
+        query = sa.select(person.c.id, *[person.c[name] for name in LEGACY_COLUMNS + REF_COLUMNS]).where(pending) \
+            .order_by(person.c.id).limit(BATCH_SIZE)
+        if last_id is not None:
+            query = query.where(person.c.id > last_id)
+
+        rows = connection.execute(query).fetchall()
+        if not rows:
+            break
+
+        values = [dict(convert(row), _id=row.id) for row in rows]
+        connection.execute(
+            person.update().where(person.c.id == sa.bindparam('_id')).values(
+                {name: sa.bindparam(name) for name in values[0] if name != '_id'}
+            ),
+            values
+        )
+        last_id = rows[-1].id
+
+
+def _to_blobs(row):
+    values = {}
+    for kind in KINDS:
+        legacy = row._mapping[f'document_{kind}']
+        ref = row._mapping[f'document_{kind}_ref']
+        if legacy and ref is None:
+            try:
+                ref = blob_store.put_base64(legacy)
+            except ValueError as e:
+                print(f'Skipping document_{kind} of person {row.id}: {e}')
+        values[f'document_{kind}_ref'] = ref
+
+    return values
+
+
+def _to_base64(row):
+    values = {}
+    for kind in KINDS:
+        legacy = row._mapping[f'document_{kind}']
+        ref = row._mapping[f'document_{kind}_ref']
+        if legacy is None and ref is not None:
+            legacy = base64.b64encode(blob_store.read_bytes(ref)).decode()
+        values[f'document_{kind}'] = legacy
+
+    return values
+
+
+def upgrade():
+    op.add_column('person', sa.Column('document_front_ref', sa.String(length=64), nullable=True))
+    op.add_column('person', sa.Column('document_back_ref', sa.String(length=64), nullable=True))
+    op.add_column('person', sa.Column('document_verification_photo_ref', sa.String(length=64), nullable=True))
+
+    # The legacy columns are kept; python -m app.document_cleanup clears them once the blob store is verified.
+    blob_store.check_store()
+    _migrate(sa.or_(*[sa.and_(person.c[f'document_{kind}'] != None, person.c[f'document_{kind}_ref'] == None)
+                      for kind in KINDS]), _to_blobs)
+
+
+def downgrade():
+    _migrate(sa.or_(*[sa.and_(person.c[f'document_{kind}_ref'] != None, person.c[f'document_{kind}'] == None)
+                      for kind in KINDS]), _to_base64)
+
+    op.drop_column('person', 'document_verification_photo_ref')
+    op.drop_column('person', 'document_back_ref')
+    op.drop_column('person', 'document_front_ref')
@@ -2,5 +2,6 @@ pwd
 pip install -r requirements.txt
 docker-compose up -d
 export $(grep -v '^#' .env | xargs)
+export BLOB_STORE_PATH=${BLOB_STORE_PATH:-$(pwd)/blobs}
 alembic upgrade head
 uvicorn app.main:app --host 0.0.0.0 --reload
@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+from app import finstat
+
+
+async def _client_per_call(ico):
+    # The lookup as it was before the shared client: a fresh connection for every call
+    async with finstat.get_semaphore():
+        async with httpx.AsyncClient() as client:
+            pub = os.environ['FINSTAT_PUBLIC_API_KEY']
+            private = os.environ['FINSTAT_PRIVATE_API_KEY']
+            result = await client.post(f"{finstat.FINSTAT_API_URL}/detail.json", data={
+                'Ico': ico,
+                'apiKey': pub,
+                'Hash': finstat.generate_hash_of_param_for_search_api(pub, private, ico)
+            })
+            return result.json()
+
+
+async def _measure(lookup, lookups: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await lookup(str(10000000 + i))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(lookups)])
+
+    return time.perf_counter() - started, sorted(latencies)
+
+
+async def main(lookups: int, concurrency: int):
+    finstat.start_client()
+    control = httpx.AsyncClient(base_url=str(httpx.URL(finstat.FINSTAT_API_URL).join("/")))
+
+    try:
+        for name, lookup in (("client per call", _client_per_call), ("shared client", finstat.fetch_company_data)):
+            await control.post("/stats/reset")
+            total, latencies = await _measure(lookup, lookups, concurrency)
+            stats = (await control.get("/stats")).json()
+            print(f"{name:16} total {total:6.2f}s  "
+                  f"p50 {statistics.median(latencies) * 1000:7.1f}ms  "
+                  f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.1f}ms  "
+                  f"requests {stats['requests']:5}  connections {stats['connections']:5}")
+    finally:
+        await control.aclose()
+        await finstat.close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare Finstat lookups with a client per call and the shared client."
+                                                 " Point FINSTAT_API_URL at scripts/finstat_stub.py.")
+    parser.add_argument("-n", "--lookups", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=finstat.FINSTAT_MAX_CONCURRENCY)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.lookups, args.concurrency))
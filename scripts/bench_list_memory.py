@@ -0,0 +1,193 @@
+import argparse
+import base64
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+SEED_PREFIX = "Memory Bench"
+SCENARIOS = ("person eager", "person", "company eager", "company")
+
+
+class CountingProxy:
+    # Sits between the app and Postgres so the bytes the database sends back can be counted
+    def __init__(self, host: str, port: int):
+        self.upstream = (host, port)
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        self.received = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self.listener.accept()
+            server = socket.create_connection(self.upstream)
+            threading.Thread(target=self._pipe, args=(client, server, False), daemon=True).start()
+            threading.Thread(target=self._pipe, args=(server, client, True), daemon=True).start()
+
+    def _pipe(self, source, target, count: bool):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                if count:
+                    with self.lock:
+                        self.received += len(data)
+                target.sendall(data)
+        except OSError:
+            pass
+        finally:
+            target.close()
+
+
+def _max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed(companies: int, persons_per_company: int, document_kb: int):
+    from app import model
+    from app.database import SessionLocal
+
+    # Random bytes do not compress, like the JPEG scans the verification flow receives
+    document = base64.b64encode(os.urandom(document_kb * 1024)).decode()
+    db = SessionLocal()
+    try:
+        for i in range(companies):
+            company = model.Company(id=uuid.uuid4(), name=f"{SEED_PREFIX} {i}", id_number=str(90000000 + i))
+            db.add(company)
+            db.add_all(model.Person(company=company, name="Jan", surname=f"Bench {i}-{j}",
+                                    email=f"bench{i}.{j}@example.com", document_front=document,
+                                    document_back=document, document_verification_photo=document)
+                       for j in range(persons_per_company))
+            db.commit()
+    finally:
+        db.close()
+
+    print(f"seeded {companies} companies with {persons_per_company} persons each, "
+          f"3 x {document_kb} kB documents per person")
+
+
+def clean():
+    from sqlalchemy import select
+
+    from app import model
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        company_ids = select(model.Company.id).where(model.Company.name.like(f"{SEED_PREFIX} %"))
+        db.query(model.Person).filter(model.Person.company_id.in_(company_ids)).delete(synchronize_session=False)
+        db.query(model.Company).filter(model.Company.id.in_(company_ids)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _eager_persons(limit: int):
+    # The list as it was served before the documents were deferred: full entities through the pydantic schema
+    from fastapi.encoders import jsonable_encoder
+    from sqlalchemy.orm import undefer_group
+
+    from app import model, schema
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        persons = db.query(model.Person).options(undefer_group("documents")).filter(model.Person.deleted_at == None) \
+            .order_by(model.Person.created_at, model.Person.id).limit(limit).all()
+        return json.dumps(jsonable_encoder([schema.Person.from_orm(person) for person in persons])).encode()
+    finally:
+        db.close()
+
+
+def _eager_companies(limit: int):
+    from fastapi.encoders import jsonable_encoder
+    from sqlalchemy.orm import selectinload
+
+    from app import model, schema
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        companies = db.query(model.Company).options(
+            selectinload(model.Company.persons).undefer_group("documents"),
+            selectinload(model.Company.addresses), selectinload(model.Company.beneficiaries)) \
+            .order_by(model.Company.created_at, model.Company.id).limit(limit).all()
+        return json.dumps(jsonable_encoder([schema.Company.from_orm(company) for company in companies])).encode()
+    finally:
+        db.close()
+
+
+def run_scenario(name: str, limit: int):
+    proxy = CountingProxy(os.environ.get("POSTGRES_HOST", "localhost"), int(os.environ.get("POSTGRES_PORT", 5432)))
+    os.environ["POSTGRES_HOST"] = "127.0.0.1"
+    os.environ["POSTGRES_PORT"] = str(proxy.port)
+
+    from fastapi.testclient import TestClient
+
+    from app import model
+    from app.auth_utils import get_current_user
+    from app.main import app
+
+    app.dependency_overrides[get_current_user] = lambda: model.User(email="bench@example.com", active=True)
+    client = TestClient(app)
+    endpoint, _, mode = name.partition(" ")
+
+    def call(size: int):
+        if mode == "eager":
+            return (_eager_persons if endpoint == "person" else _eager_companies)(size)
+
+        response = client.get(f"/{endpoint}", params={"limit": size})
+        response.raise_for_status()
+        return response.content
+
+    # Warm up imports and the connection pool so only the listing itself is measured
+    call(1)
+    rss_before = _max_rss_mb()
+    received_before = proxy.received
+    started = time.perf_counter()
+    body = call(limit)
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({"scenario": name, "seconds": elapsed, "rss_growth_mb": _max_rss_mb() - rss_before,
+                      "db_mb": (proxy.received - received_before) / 1024 / 1024,
+                      "response_mb": len(body) / 1024 / 1024}))
+
+
+def main(limit: int):
+    for name in SCENARIOS:
+        # A fresh interpreter per scenario, peak RSS never goes back down
+        output = subprocess.run([sys.executable, "-m", "scripts.bench_list_memory", "--scenario", name,
+                                 "--limit", str(limit)], check=True, stdout=subprocess.PIPE, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"GET /{name:14} {result['seconds'] * 1000:8.1f}ms  peak RSS +{result['rss_growth_mb']:7.1f}MB  "
+              f"from db {result['db_mb']:7.2f}MB  response {result['response_mb']:7.2f}MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare memory and bytes moved by the person and company lists with "
+                                                 "the documents loaded eagerly and deferred.")
+    parser.add_argument("--seed", action="store_true", help="add benchmark companies and persons with documents")
+    parser.add_argument("--clean", action="store_true", help="remove the benchmark companies and persons")
+    parser.add_argument("--companies", type=int, default=100)
+    parser.add_argument("--persons-per-company", type=int, default=1)
+    parser.add_argument("--document-kb", type=int, default=300, help="size of each decoded document image")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        run_scenario(args.scenario, args.limit)
+    elif args.clean:
+        clean()
+    elif args.seed:
+        seed(args.companies, args.persons_per_company, args.document_kb)
+    else:
+        main(args.limit)
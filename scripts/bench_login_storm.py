@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+
+import httpx
+
+EMAIL = "login-storm@example.com"
+PASSWORD = "login-storm"
+
+
+def serve(port: int, inline: bool):
+    import uvicorn
+
+    from app import hashing, model
+    from app.database import SessionLocal
+    from app.main import app
+
+    if inline:
+        # Hash on the event loop like the login route did before the hashing pool
+        async def run_inline(function, *args):
+            return function(*args)
+
+        hashing._run = run_inline
+
+    db = SessionLocal()
+    try:
+        if db.query(model.User).filter(model.User.email == EMAIL).first() is None:
+            db.add(model.User(email=EMAIL, password=hashing.pwd_context.hash(PASSWORD), active=True))
+            db.commit()
+    finally:
+        db.close()
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _percentile(values, share: float):
+    return values[min(len(values) - 1, int(len(values) * share))] * 1000
+
+
+async def _probe(client: httpx.AsyncClient, done: asyncio.Event, interval: float):
+    latencies = []
+    while not done.is_set():
+        started = time.perf_counter()
+        await client.get("/")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+    return sorted(latencies)
+
+
+async def _probe_for(client: httpx.AsyncClient, interval: float, probes: int):
+    latencies = []
+    for _ in range(probes):
+        started = time.perf_counter()
+        await client.get("/")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+    return sorted(latencies)
+
+
+async def _login(client: httpx.AsyncClient):
+    response = await client.post("/token", data={"username": EMAIL, "password": PASSWORD})
+
+    return response.status_code
+
+
+async def _storm(base_url: str, logins: int, interval: float):
+    limits = httpx.Limits(max_connections=logins + 1, max_keepalive_connections=logins + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        # The first login starts the hashing workers, keep it out of the numbers
+        await _login(client)
+
+        idle = await _probe_for(client, interval, 50)
+
+        done = asyncio.Event()
+        probe = asyncio.create_task(_probe(client, done, interval))
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*[_login(client) for _ in range(logins)])
+        elapsed = time.perf_counter() - started
+        done.set()
+
+        return idle, await probe, statuses, elapsed
+
+
+def _wait_until_up(base_url: str, server: subprocess.Popen):
+    for _ in range(300):
+        if server.poll() is not None:
+            sys.exit("The benchmark server exited during startup")
+        try:
+            httpx.get(f"{base_url}/")
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+
+    sys.exit("The benchmark server did not start")
+
+
+def main(port: int, logins: int, interval: float):
+    base_url = f"http://127.0.0.1:{port}"
+
+    for name, options in (("hashing pool", []), ("inline bcrypt", ["--inline"])):
+        server = subprocess.Popen([sys.executable, "-m", "scripts.bench_login_storm", "--serve", "--port", str(port)]
+                                  + options)
+        try:
+            _wait_until_up(base_url, server)
+            idle, storm, statuses, elapsed = asyncio.run(_storm(base_url, logins, interval))
+        finally:
+            server.terminate()
+            server.wait()
+
+        print(f"{name:14} idle / p50 {_percentile(idle, 0.5):7.1f}ms  p95 {_percentile(idle, 0.95):7.1f}ms | "
+              f"storm / p50 {_percentile(storm, 0.5):7.1f}ms  p95 {_percentile(storm, 0.95):7.1f}ms  "
+              f"max {storm[-1] * 1000:7.1f}ms | logins {statuses.count(200)} ok / {statuses.count(503)} shed / "
+              f"{len(statuses) - statuses.count(200) - statuses.count(503)} failed in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure / latency while a burst of logins hits /token, with the "
+                                                 "hashing pool and with bcrypt on the event loop.")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("-n", "--logins", type=int, default=60)
+    parser.add_argument("--interval-ms", type=float, default=10, help="pause between / probes")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--inline", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.inline)
+    else:
+        main(args.port, args.logins, args.interval_ms / 1000)
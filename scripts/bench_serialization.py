@@ -0,0 +1,137 @@
+import argparse
+import json
+import statistics
+import time
+import uuid
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app import model, repository, schema, serializers
+from app.database import SessionLocal
+
+SEED_PREFIX = "Serialization Bench"
+
+
+def seed(companies: int, persons_per_company: int):
+    db = SessionLocal()
+    try:
+        for i in range(companies):
+            company = model.Company(id=uuid.uuid4(), name=f"{SEED_PREFIX} {i}", id_number=str(80000000 + i),
+                                    dic=str(2020000000 + i), registry="Obchodny register Bratislava")
+            db.add(company)
+            db.add(model.Address(company=company, city="Bratislava", street="Hlavna", number=str(i), zip="81101"))
+            db.add(model.Beneficiary(company=company, name="Eva", surname=f"Bench {i}"))
+            for j in range(persons_per_company):
+                person = model.Person(company=company, name="Jan", surname=f"Bench {i}-{j}", country="SK",
+                                      email=f"serialization{i}.{j}@example.com", id_number=f"9001{i:04}/{j:04}")
+                db.add(person)
+                db.add(model.Address(person=person, city="Kosice", street="Mlynska", number=str(j), zip="04001"))
+            db.commit()
+    finally:
+        db.close()
+
+    print(f"seeded {companies} companies with {persons_per_company} persons each")
+
+
+def clean():
+    db = SessionLocal()
+    try:
+        company_ids = select(model.Company.id).where(model.Company.name.like(f"{SEED_PREFIX} %"))
+        person_ids = select(model.Person.id).where(model.Person.company_id.in_(company_ids))
+        db.query(model.Address).filter(model.Address.person_id.in_(person_ids)).delete(synchronize_session=False)
+        db.query(model.Address).filter(model.Address.company_id.in_(company_ids)).delete(synchronize_session=False)
+        db.query(model.Beneficiary).filter(model.Beneficiary.company_id.in_(company_ids)) \
+            .delete(synchronize_session=False)
+        db.query(model.Person).filter(model.Person.company_id.in_(company_ids)).delete(synchronize_session=False)
+        db.query(model.Company).filter(model.Company.id.in_(company_ids)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _json_body(content):
+    # What JSONResponse renders after FastAPI has validated the ORM objects against response_model
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def orm_companies(db, limit: int):
+    companies = db.query(model.Company).options(
+        selectinload(model.Company.addresses), selectinload(model.Company.persons),
+        selectinload(model.Company.beneficiaries)).order_by(model.Company.created_at, model.Company.id) \
+        .limit(limit).all()
+
+    return _json_body([schema.Company.from_orm(company) for company in companies])
+
+
+def orjson_companies(db, limit: int):
+    rows = repository.get_companies(db, limit=limit)
+
+    return ORJSONResponse(serializers.company_dicts(db, rows)).body
+
+
+def orm_persons(db, limit: int):
+    persons = db.query(model.Person).filter(model.Person.deleted_at == None) \
+        .order_by(model.Person.created_at, model.Person.id).limit(limit).all()
+
+    return _json_body([schema.Person.from_orm(person) for person in persons])
+
+
+def orjson_persons(db, limit: int):
+    rows = repository.get_persons(db, limit=limit)
+
+    return ORJSONResponse(serializers.person_dicts(db, rows)).body
+
+
+PATHS = (
+    ("GET /company", orm_companies, orjson_companies),
+    ("GET /person", orm_persons, orjson_persons),
+)
+
+
+def _measure(render, limit: int, repeat: int):
+    wall = []
+    cpu = []
+    for _ in range(repeat):
+        # A new session each time so the identity map does not hand back already loaded objects
+        db = SessionLocal()
+        try:
+            started, started_cpu = time.perf_counter(), time.process_time()
+            body = render(db, limit)
+            wall.append(time.perf_counter() - started)
+            cpu.append(time.process_time() - started_cpu)
+        finally:
+            db.close()
+
+    return statistics.median(wall), statistics.median(cpu), len(body)
+
+
+def main(limit: int, repeat: int):
+    for route, orm_render, orjson_render in PATHS:
+        for name, render in (("orm + pydantic", orm_render), ("projection + orjson", orjson_render)):
+            _measure(render, 1, 1)
+            wall, cpu, size = _measure(render, limit, repeat)
+            print(f"{route:13} {name:20} wall {wall * 1000:8.1f}ms  cpu {cpu * 1000:8.1f}ms  "
+                  f"response {size / 1024:8.1f}kB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the list responses rendered from ORM objects through "
+                                                 "pydantic and from projected rows through orjson.")
+    parser.add_argument("--seed", action="store_true", help="add benchmark companies with persons and addresses")
+    parser.add_argument("--clean", action="store_true", help="remove the benchmark companies")
+    parser.add_argument("--companies", type=int, default=1000)
+    parser.add_argument("--persons-per-company", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("-r", "--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.clean:
+        clean()
+    elif args.seed:
+        seed(args.companies, args.persons_per_company)
+    else:
+        main(args.limit, args.repeat)
@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import random
+
+import uvicorn
+from fastapi import FastAPI, Form
+from fastapi.responses import JSONResponse
+
+FIELDS = ("Ico", "Dic", "IcDPH", "Name", "Street", "StreetNumber", "ZipCode", "City", "District", "Region", "Country",
+          "Activity", "Created", "Cancelled", "Url", "Revenue", "RevenueActual")
+
+app = FastAPI()
+app.state.latency = 0.0
+app.state.error_rate = 0.0
+app.state.requests = 0
+app.state.connections = set()
+
+
+@app.post("/api/detail.json")
+async def detail(Ico: str = Form(...), apiKey: str = Form(...), Hash: str = Form(...)):
+    app.state.requests += 1
+    await asyncio.sleep(app.state.latency)
+
+    if random.random() < app.state.error_rate:
+        return JSONResponse({"error": "stub failure"}, status_code=503)
+
+    company = {field: None for field in FIELDS}
+    company.update(Ico=Ico, Name=f"Stub company {Ico}", City="Bratislava", Country="Slovensko")
+
+    return company
+
+
+@app.middleware("http")
+async def count_connections(request, call_next):
+    app.state.connections.add(request.scope.get("client"))
+    return await call_next(request)
+
+
+@app.get("/stats")
+def stats():
+    return {"requests": app.state.requests, "connections": len(app.state.connections)}
+
+
+@app.post("/stats/reset")
+def reset_stats():
+    app.state.requests = 0
+    app.state.connections = set()
+
+    return stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Finstat detail API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=20, help="delay added to every lookup")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of lookups answered with 503")
+    args = parser.parse_args()
+
+    app.state.latency = args.latency_ms / 1000
+    app.state.error_rate = args.error_rate
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy.exc import OperationalError
+from sqlalchemy_utils import create_database, database_exists, drop_database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TABLES = ("address", "person", "beneficiary", "company", "reset_token", '"user"', "finstat_cache")
+
+os.environ["POSTGRES_DATABASE"] = os.environ.get("TEST_POSTGRES_DATABASE", "tp_test")
+os.environ.setdefault("BLOB_STORE_PATH", tempfile.mkdtemp())
+
+
+def _db_link():
+    return f'postgresql://{os.environ["POSTGRES_USER"]}:{os.environ["POSTGRES_PASSWORD"]}@' \
+           f'{os.environ["POSTGRES_HOST"]}:{os.environ["POSTGRES_PORT"]}/{os.environ["POSTGRES_DATABASE"]}'
+
+
+@pytest.fixture(scope="session")
+def database():
+    if not all(f"POSTGRES_{name}" in os.environ for name in ("USER", "PASSWORD", "HOST", "PORT")):
+        pytest.skip("POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST and POSTGRES_PORT must be set")
+
+    url = _db_link()
+    try:
+        if database_exists(url):
+            drop_database(url)
+        create_database(url)
+    except OperationalError as e:
+        pytest.skip(f"PostgreSQL is not reachable: {e}")
+
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    command.upgrade(config, "head")
+
+    yield
+
+    from app.database import engine, read_engine
+    engine.dispose()
+    read_engine.dispose()
+    drop_database(url)
+
+
+@pytest.fixture
+def db(database):
+    from sqlalchemy import text
+    from app.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.execute(text(f"TRUNCATE {', '.join(TABLES)} CASCADE"))
+        session.commit()
+        session.close()
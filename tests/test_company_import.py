@@ -0,0 +1,38 @@
+import asyncio
+
+
+class _Request:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    async def stream(self):
+        for start in range(0, len(self.body), 7):
+            yield self.body[start:start + 7]
+
+
+def _rows(body: bytes):
+    from app import company_import
+
+    async def collect():
+        return [row async for row in company_import._iter_csv_rows(_Request(body))]
+
+    return asyncio.run(collect())
+
+
+def test_multiline_quoted_field_is_one_row(database):
+    rows = _rows(b'name,id_number\n"Line one\nline two",12345678\nNext,87654321\n')
+
+    assert rows == [(["name", "id_number"], None), (["Line one\nline two", "12345678"], None),
+                    (["Next", "87654321"], None)]
+
+
+def test_unclosed_quote_is_reported_and_parsing_resumes(database, monkeypatch):
+    from app import company_import
+
+    monkeypatch.setattr(company_import, "IMPORT_MAX_RECORD_LINES", 3)
+    rows = _rows(b'name,id_number\n"Broken,11111111\nA,22222222\nB,33333333\nC,44444444\nD,55555555\n')
+
+    assert rows[0] == (["name", "id_number"], None)
+    assert rows[1][0] is None
+    assert "line 2" in rows[1][1]
+    assert rows[2:] == [(["D", "55555555"], None)]
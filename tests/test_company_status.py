@@ -0,0 +1,101 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+PERSONS = 20
+
+
+def _seed_company(db, status, persons=0):
+    from app import model
+
+    company = model.Company(name=f"Status Test {uuid.uuid4()}", id_number=str(uuid.uuid4().int)[:8], status=status,
+                            persons_active=persons)
+    db.add(company)
+    people = [model.Person(company=company, name="Jan", surname=str(i), email=f"jan{i}@example.com",
+                           requested_at=datetime.now()) for i in range(persons)]
+    db.add_all(people)
+    db.commit()
+
+    return company, [person.id for person in people]
+
+
+def _run(coroutines):
+    from app.database import async_engine
+
+    async def run():
+        try:
+            return await asyncio.gather(*coroutines)
+        finally:
+            # pooled asyncpg connections are bound to this event loop
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+
+async def _verify(person_id):
+    from app import async_repository, schema
+    from app.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as session:
+        db_person = await async_repository.get_person(session, person_id)
+        await async_repository.verify_person(session, db_person, schema.PersonVerify(id=person_id, name="Jan"))
+
+
+async def _aml_completed(company_id):
+    from app import company_status
+    from app.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as session:
+        changed = await company_status.apply_async(session, company_status.aml_completed(company_id))
+        await session.commit()
+
+    return changed
+
+
+def test_parallel_verifications_complete_kyc_only_after_last_person(db):
+    from app import company_status
+
+    company, person_ids = _seed_company(db, company_status.KYC_REQUESTED, PERSONS)
+
+    _run([_verify(person_id) for person_id in person_ids[:-1]])
+    db.refresh(company)
+    assert company.persons_verified == PERSONS - 1
+    assert company.status == company_status.KYC_REQUESTED
+
+    _run([_verify(person_ids[-1])])
+    db.refresh(company)
+    assert company.persons_verified == PERSONS
+    assert company.status == company_status.KYC_VERIFIED
+
+
+def test_parallel_verifications_of_all_persons(db):
+    from app import company_status
+
+    company, person_ids = _seed_company(db, company_status.KYC_REQUESTED, PERSONS)
+
+    _run([_verify(person_id) for person_id in person_ids])
+    db.refresh(company)
+    assert company.persons_verified == PERSONS
+    assert company.status == company_status.KYC_VERIFIED
+
+
+def test_parallel_transitions_apply_once(db):
+    from app import company_status
+
+    company, _ = _seed_company(db, company_status.BENEFICIARIES_ADDED)
+
+    results = _run([_aml_completed(company.id) for _ in range(PERSONS)])
+    db.refresh(company)
+    assert results.count(True) == 1
+    assert company.status == company_status.AML_COMPLETED
+
+
+def test_parallel_verifications_of_one_person_count_once(db):
+    from app import company_status
+
+    company, person_ids = _seed_company(db, company_status.KYC_REQUESTED, 2)
+
+    _run([_verify(person_ids[0]) for _ in range(PERSONS)])
+    db.refresh(company)
+    assert company.persons_verified == 1
+    assert company.status == company_status.KYC_REQUESTED
@@ -0,0 +1,45 @@
+import asyncio
+
+FIELDS = ("Ico", "Dic", "IcDPH", "Name", "Street", "StreetNumber", "ZipCode", "City", "District", "Region", "Country",
+          "Activity", "Created", "Cancelled", "Url", "Revenue", "RevenueActual")
+
+
+def _refresh(ico):
+    from app import finstat
+    from app.database import async_engine
+
+    async def run():
+        try:
+            return await finstat._refresh(ico)
+        finally:
+            # pooled asyncpg connections are bound to this event loop
+            await async_engine.dispose()
+
+    try:
+        return asyncio.run(run())
+    finally:
+        finstat.company_cache.clear()
+
+
+def test_refresh_writes_finstat_data_to_company(db, monkeypatch):
+    from app import finstat, model
+    from app.suggest import company_index
+
+    company = model.Company(name="Old Name", id_number="87654321")
+    db.add(company)
+    db.commit()
+
+    async def fetch_company_data(ico):
+        data = {field: None for field in FIELDS}
+        data.update(Ico=ico, Name="Finstat Refresh s.r.o.", Dic="2021234567", City="Bratislava")
+        return data
+
+    monkeypatch.setattr(finstat, "fetch_company_data", fetch_company_data)
+    _, fetched_at = _refresh("87654321")
+
+    db.refresh(company)
+    assert company.name == "Finstat Refresh s.r.o."
+    assert company.dic == "2021234567"
+    assert company.finstat_at == fetched_at
+    assert [address.city for address in company.addresses] == ["Bratislava"]
+    assert [match["id"] for match in company_index.suggest("finstat refresh")] == [company.id]
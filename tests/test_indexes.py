@@ -0,0 +1,97 @@
+import uuid
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, text
+
+COMPANY_ID = uuid.uuid4()
+PERSON_ID = uuid.uuid4()
+BENEFICIARY_ID = uuid.uuid4()
+
+
+@contextmanager
+def explained(db):
+    from app.database import engine
+
+    plans = []
+
+    def explain(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+            plans.append(cursor.fetchone()[0][0]["Plan"])
+
+    # Tiny test tables are always cheaper to scan sequentially, so only fall back to a seq scan without an index
+    db.execute(text("SET enable_seqscan = off"))
+    event.listen(engine, "before_cursor_execute", explain)
+    try:
+        yield plans
+    finally:
+        event.remove(engine, "before_cursor_execute", explain)
+
+
+def _nodes(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _nodes(child)
+
+
+@pytest.fixture
+def seeded(db):
+    from app import model
+
+    company = model.Company(id=COMPANY_ID, name="Index Test", id_number="12345678")
+    db.add(company)
+    db.add(model.Person(id=PERSON_ID, company=company, name="Jan", surname="Novak", email="jan@example.com",
+                        id_number="900101/1234"))
+    db.add(model.Beneficiary(id=BENEFICIARY_ID, company=company, name="Eva", surname="Nova"))
+    db.add(model.Address(company=company, city="Bratislava"))
+    db.add(model.Address(person_id=PERSON_ID, city="Kosice"))
+    db.add(model.User(email="user@example.com", active=True))
+    db.commit()
+
+    return db
+
+
+LOOKUPS = {
+    "get_company_by_id_number": (lambda repository, db: repository.get_company_by_id_number(db, "12345678"),
+                                 {"ix_company_id_number"}),
+    "get_user_by_email": (lambda repository, db: repository.get_user_by_email(db, "user@example.com"),
+                          {"ix_user_email"}),
+    "get_person_by_id_number": (lambda repository, db: repository.get_person_by_id_number(db, "900101/1234"),
+                                {"ix_person_id_number_active"}),
+    "get_beneficiary_by_name_surname_company": (
+        lambda repository, db: repository.get_beneficiary_by_name_surname_company(db, "Eva", "Nova", COMPANY_ID),
+        {"ix_beneficiary_company_id_name_surname_active"}),
+    "get_addresses_by_company": (lambda repository, db: repository.get_addresses_by_company(db, COMPANY_ID),
+                                 {"ix_address_company_id"}),
+    "get_addresses_by_person": (lambda repository, db: repository.get_addresses_by_person(db, PERSON_ID),
+                                {"ix_address_person_id"}),
+    "get_person_by_company_and_id": (
+        lambda repository, db: repository.get_person_by_company_and_id(db, COMPANY_ID, PERSON_ID), set()),
+    "get_person": (lambda repository, db: repository.get_person(db, PERSON_ID), set()),
+    "get_beneficiary": (lambda repository, db: repository.get_beneficiary(db, BENEFICIARY_ID), set()),
+    "get_company": (lambda repository, db: repository.get_company(db, COMPANY_ID, with_relations=True), set()),
+    "get_company_relations": (
+        lambda repository, db: repository.get_company_relations(db, [COMPANY_ID], repository.COMPANY_RELATIONS),
+        set()),
+    "get_companies": (lambda repository, db: repository.get_companies(db), set()),
+    "get_persons": (lambda repository, db: repository.get_persons(db), set()),
+    "get_beneficiaries": (lambda repository, db: repository.get_beneficiaries(db), set()),
+}
+
+
+@pytest.mark.parametrize("name", LOOKUPS)
+def test_repository_lookup_uses_index_scan(seeded, name):
+    from app import repository
+
+    lookup, expected_indexes = LOOKUPS[name]
+
+    with explained(seeded) as plans:
+        lookup(repository, seeded)
+
+    assert plans
+    nodes = [node for plan in plans for node in _nodes(plan)]
+    scans = [(node["Node Type"], node["Relation Name"]) for node in nodes if "Relation Name" in node]
+    assert scans
+    assert [scan for scan in scans if scan[0] == "Seq Scan"] == []
+    assert expected_indexes <= {node["Index Name"] for node in nodes if "Index Name" in node}
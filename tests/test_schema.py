@@ -0,0 +1,37 @@
+import pytest
+
+
+@pytest.mark.parametrize("summary, fields, relations", [
+    ("CompanySummary", "COMPANY_FIELDS", ("addresses", "persons", "beneficiaries")),
+    ("PersonSummary", "PERSON_FIELDS", ("addresses",)),
+])
+def test_summary_documents_every_selectable_field(database, summary, fields, relations):
+    from app import schema, serializers
+
+    model = getattr(schema, summary)
+    selectable = set(getattr(serializers, fields)) | set(relations)
+
+    assert selectable <= set(model.__fields__)
+    # id is returned for every fieldset, everything else may be left out
+    assert [name for name in selectable if model.__fields__[name].required] == ["id"]
+
+
+@pytest.mark.parametrize("document, valid", [
+    ("aGVsbG8=", True),
+    ("data:image/png;base64,aGVsbG8=", True),
+    ("aGVs*bG8=", False),
+    ("aGVsbG8", False),
+    ("aGVs\nbG8=", False),
+])
+def test_person_documents_must_be_strict_base64(database, document, valid):
+    from pydantic import ValidationError
+
+    from app import blob_store, schema
+
+    assert blob_store.is_base64(document) == valid
+    if valid:
+        assert schema.PersonCreate(document_front=document).document_front == document
+        assert blob_store.decode_base64(document) == b"hello"
+    else:
+        with pytest.raises(ValidationError):
+            schema.PersonCreate(document_front=document)